@@ -31,6 +31,7 @@ public class ControlRobot : MonoBehaviour
     [SerializeField] private float robotFollowDist = 49.21f; // [units] equal to 5m
     [SerializeField] private float robotStopDist = 4.92f;   // [units] equal to 0.5m
     [SerializeField] private float robotDt = 0.5f;          // [s] how often robot changes objective
+    [SerializeField] private bool useIntercept = true;      // head for Python's intercept point when sent
 
     // ------------------------------------------------------------
     [Header("Animation & Audio")]
@@ -318,6 +319,16 @@ public class ControlRobot : MonoBehaviour
         return new Vector3(p.predictedX, p.predictedY, p.predictedZ);
     }
 
+    Vector3 InterceptShooterPosition()
+    {
+        // point on the predicted path this robot reaches first (from Python), else the predicted position
+        var p = transform.parent.GetComponent<ShooterPredictor>();
+        Vector3 target;
+        if (useIntercept && p.TryGetIntercept(this.gameObject, out target))
+            return target;
+        return PredictShooterPosition();
+    }
+
     void ApplyObjective(string currObj)
     {
         //apply objective
@@ -333,14 +344,14 @@ public class ControlRobot : MonoBehaviour
         }
         else if (currObj == "race")
         {
-            _targetPos = PredictShooterPosition();  // shooter predicted position
+            _targetPos = InterceptShooterPosition();  // cut off the shooter's predicted path
             _targetSpeed = 1f;  // portion of max speed
 
         }
 
         else if (currObj == "search")
         {
-            _targetPos = PredictShooterPosition();  // shooter predicted position
+            _targetPos = InterceptShooterPosition();  // cut off the shooter's predicted path
             _targetSpeed = 1f; // portion of max speed
 
         }
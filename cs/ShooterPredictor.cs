@@ -7,6 +7,7 @@
 
 using System;
 using System.Collections;
+using System.IO;
 using System.Net;
 using System.Net.Sockets;
 using System.Text;
@@ -42,6 +43,8 @@ public class ShooterPredictor : MonoBehaviour
     [SerializeField] private  string ipAddress = "127.0.0.1"; // local host
     [SerializeField] private  int rxPort = 8000;            // port to receive data
     [SerializeField] private  int txPort = 8001;            // port to send data
+    [SerializeField] private bool useBinary = true;         // request compact binary frames from Python
+    [SerializeField] private int sessionId = 0;             // station id when sharing one Python server (0: none)
 
     // ------------------------------------------------------------
     [Header("Visibility Settings")]
@@ -49,6 +52,7 @@ public class ShooterPredictor : MonoBehaviour
     [SerializeField] private float offsetShooterHeight = 2.5f;  // offset for raycasting
     [SerializeField] private float offsetObjHeight = 2.5f;      // offset for raycasting
     [SerializeField] private float offsetProbeMax = 5f;         // offset for raycasting
+    [SerializeField] private bool sendVisibility = true;        // false: Python computes visibility (binary frames only)
 
     // ------------------------------------------------------------
     [Header("Debug Settings")]
@@ -61,6 +65,7 @@ public class ShooterPredictor : MonoBehaviour
     private List<float> predictedXList = new List<float>();     // predicted x sequence
     private List<float> predictedYList = new List<float>();     // predicted y sequence
     private List<float> predictedZList = new List<float>();     // predicted z sequence
+    private Vector3?[] interceptTargets = new Vector3?[2];      // intercept point per robot (null: none sent)
 
     private GameObject player;                                  // player object
 
@@ -80,6 +85,13 @@ public class ShooterPredictor : MonoBehaviour
     private bool keepReceiving = true;                          // flag for continuing to send data
     private readonly object predictionLock = new object();
 
+    private static readonly byte[] binaryMagic = { (byte)'S', (byte)'P' };  // first bytes of binary messages
+    private const byte replyVersion = 1;                        // binary reply version (see wire.py)
+    private const byte kindFrame = 1;                           // Unity -> Python state frame
+    private const byte kindReply = 2;                           // Python -> Unity trajectory
+    private const string helloPrefix = "HELLO";                 // text handshake, "HELLO;<version>"
+    private volatile bool binaryAccepted = false;               // whether Python agreed to binary frames
+
     // ---------------------------------------------------------------------------------------------
     // Main execution
     // ---------------------------------------------------------------------------------------------
@@ -191,6 +203,17 @@ public class ShooterPredictor : MonoBehaviour
             float totalTime = GameTimers.Instance.TotalTime;
             string timeInfo = totalTime + "," + shootTime + "," + timeAhead;
 
+            // binary frame once negotiated, otherwise keep asking while sending text
+            if (binaryAccepted)
+            {
+                SendData(BuildBinaryFrame(totalTime, shootTime, nShot, nReload, nDryFire, nRobotHit,
+                                          focusName, focusPos, rightEyeDiam, leftEyeDiam));
+                yield return new WaitForSeconds(1f / outFreq);
+                continue;
+            }
+            if (useBinary)
+                SendData(helloPrefix + ";" + FrameVersion());
+
             // npc info
             string npcPos = ""; // to be converted into float
             string npcVis = ""; // to be converted into int (visible or not)
@@ -225,7 +248,8 @@ public class ShooterPredictor : MonoBehaviour
             string robotInfo = "" + visToR1 + "," + visToR2 + "," + robot1Pos + "," + robot2Pos;
 
             // write info to Python
-            string total = timeInfo + ";" + playerInfo + ";" + npcInfo + ";" + doInfo + ";" + dcInfo + ";" + robotInfo;
+            string sessionInfo = (sessionId > 0) ? "@" + sessionId + ";" : "";
+            string total = sessionInfo + timeInfo + ";" + playerInfo + ";" + npcInfo + ";" + doInfo + ";" + dcInfo + ";" + robotInfo;
             SendData(total);
 
             yield return new WaitForSeconds(1f / outFreq);
@@ -233,10 +257,14 @@ public class ShooterPredictor : MonoBehaviour
     }
 
     void SendData(string message)
+    {
+        SendData(Encoding.UTF8.GetBytes(message));
+    }
+
+    void SendData(byte[] data)
     {
         try
         {
-            byte[] data = Encoding.UTF8.GetBytes(message);
             client.Send(data, data.Length, remoteEndPoint);
         }
         catch (Exception err)
@@ -245,6 +273,155 @@ public class ShooterPredictor : MonoBehaviour
         }
     }
 
+    byte FrameVersion()
+    {
+        // version 2 adds the session id to the header, version 3 drops the visibility flags
+        if (!sendVisibility)
+            return 3;
+        return (byte)((sessionId > 0) ? 2 : 1);
+    }
+
+    byte[] BuildBinaryFrame(float totalTime, float shootTime, int nShot, int nReload, int nDryFire, int nRobotHit,
+                            string focusName, Vector3 focusPos, float rightEyeDiam, float leftEyeDiam)
+    {
+        int nNpc = avatarParent.transform.childCount;
+        byte version = FrameVersion();
+        using (MemoryStream stream = new MemoryStream())
+        using (BinaryWriter writer = new BinaryWriter(stream))  // always little-endian
+        {
+            // header
+            writer.Write(binaryMagic);
+            writer.Write(version);
+            writer.Write(kindFrame);
+            writer.Write((ushort)nNpc);
+            writer.Write((ushort)doList.Count);
+            writer.Write((ushort)dcList.Count);
+            if (version >= 2)
+                writer.Write((ushort)sessionId);
+
+            // time info
+            writer.Write(totalTime);
+            writer.Write(shootTime);
+            writer.Write((float)timeAhead);
+
+            // player info (pose, gun, eyes)
+            Vector3 pos = player.transform.position;
+            Vector3 rot = player.transform.rotation.eulerAngles;
+            writer.Write(round(pos.x)); writer.Write(round(pos.y)); writer.Write(round(pos.z));
+            writer.Write(round(rot.x)); writer.Write(round(rot.y)); writer.Write(round(rot.z));
+            writer.Write(nShot); writer.Write(nReload); writer.Write(nDryFire); writer.Write(nRobotHit);
+            writer.Write(round(focusPos.x)); writer.Write(round(focusPos.y)); writer.Write(round(focusPos.z));
+            writer.Write(rightEyeDiam);
+            writer.Write(leftEyeDiam);
+            byte[] name = Encoding.UTF8.GetBytes(focusName);
+            int nameLength = Math.Min(name.Length, 255);
+            writer.Write((byte)nameLength);
+            writer.Write(name, 0, nameLength);
+
+            // npc info (positions, then visibility, then state)
+            byte[] npcVis = new byte[nNpc];
+            byte[] npcState = new byte[nNpc];
+            int i = 0;
+            foreach (Transform child in avatarParent.transform)
+            {
+                writer.Write(round(child.position.x)); writer.Write(round(child.position.y)); writer.Write(round(child.position.z));
+                npcVis[i] = (byte)((version < 3) ? CheckVisible(child) : 0);
+                npcState[i] = (byte)((child.gameObject.tag != "dead") ? 1 : 0);
+                i++;
+            }
+            if (version < 3)
+                writer.Write(npcVis);
+            writer.Write(npcState);
+
+            // door info (version 3 leaves visibility to Python)
+            if (version < 3)
+            {
+                foreach (Transform child in doList)
+                    writer.Write((byte)CheckVisible(child));
+                foreach (Transform child in dcList)
+                    writer.Write((byte)CheckVisible(child));
+            }
+
+            // robot info (trailer, used for intercept points)
+            writer.Write((byte)2);
+            foreach (GameObject robot in new[] { robot1, robot2 })
+            {
+                writer.Write(round(robot.transform.position.x)); writer.Write(round(robot.transform.position.y)); writer.Write(round(robot.transform.position.z));
+            }
+
+            writer.Flush();
+            return stream.ToArray();
+        }
+    }
+
+    bool ParseBinaryReply(byte[] data, out float[] xs, out float[] ys, out float[] zs, Vector3?[] targets)
+    {
+        xs = ys = zs = null;
+        using (MemoryStream stream = new MemoryStream(data))
+        using (BinaryReader reader = new BinaryReader(stream))
+        {
+            reader.ReadBytes(2); // magic
+            byte version = reader.ReadByte();
+            byte kind = reader.ReadByte();
+            if (version != replyVersion || kind != kindReply)
+                return false;
+
+            reader.ReadSingle(); // time echoed back
+            int n = reader.ReadUInt16();
+            if (data.Length < 10 + 12 * n)
+                return false;
+
+            xs = new float[n];
+            ys = new float[n];
+            zs = new float[n];
+            for (int i = 0; i < n; i++) xs[i] = reader.ReadSingle();
+            for (int i = 0; i < n; i++) ys[i] = reader.ReadSingle();
+            for (int i = 0; i < n; i++) zs[i] = reader.ReadSingle();
+
+            // trailers: model used and wanted, then intercept points (robot index, xyz)
+            if (data.Length - stream.Position < 3)
+                return true;
+            reader.ReadBytes(2);
+            int nTarget = reader.ReadByte();
+            for (int i = 0; i < nTarget && data.Length - stream.Position >= 13; i++)
+            {
+                int robot = reader.ReadByte();
+                Vector3 target = new Vector3(reader.ReadSingle(), reader.ReadSingle(), reader.ReadSingle());
+                if (robot < targets.Length)
+                    targets[robot] = target;
+            }
+        }
+        return true;
+    }
+
+    void ParseTextTargets(string section, Vector3?[] targets)
+    {
+        // "index,x,y,z,..." per robot with an intercept point
+        string[] values = section.Split(",", StringSplitOptions.RemoveEmptyEntries);
+        for (int i = 0; i + 3 < values.Length; i += 4)
+        {
+            int robot = int.Parse(values[i]);
+            if (robot < targets.Length)
+                targets[robot] = new Vector3(float.Parse(values[i + 1]), float.Parse(values[i + 2]), float.Parse(values[i + 3]));
+        }
+    }
+
+    public bool TryGetIntercept(GameObject robot, out Vector3 target)
+    {
+        // intercept point Python picked for this robot in the latest reply
+        int i = (robot == robot1) ? 0 : (robot == robot2) ? 1 : -1;
+        lock (predictionLock)
+        {
+            if (i >= 0 && interceptTargets[i].HasValue)
+            {
+                target = interceptTargets[i].Value;
+                return true;
+            }
+        }
+        target = Vector3.zero;
+        return false;
+    }
+
     void ReceiveData()
     {
         while (keepReceiving)
@@ -253,15 +430,47 @@ public class ShooterPredictor : MonoBehaviour
             {
                 IPEndPoint anyIP = new IPEndPoint(IPAddress.Any, 0);
                 byte[] data = client.Receive(ref anyIP);
-                string text = Encoding.UTF8.GetString(data);
 
-                string[] sects = text.Split(";");
-                if (sects.Length < 4)
-                    continue; // malformed packet
+                float[] xs, ys, zs;
+                Vector3?[] targets = new Vector3?[interceptTargets.Length];
+                if (data.Length >= 2 && data[0] == binaryMagic[0] && data[1] == binaryMagic[1])
+                {
+                    if (!ParseBinaryReply(data, out xs, out ys, out zs, targets))
+                        continue; // malformed packet
+                }
+                else
+                {
+                    string text = Encoding.UTF8.GetString(data);
+
+                    // handshake reply: "HELLO;<version>", 0 keeps text
+                    if (text.StartsWith(helloPrefix))
+                    {
+                        binaryAccepted = (text == helloPrefix + ";" + FrameVersion());
+                        continue;
+                    }
 
-                string[] xStrs = sects[1].Split(",");
-                string[] yStrs = sects[2].Split(",");
-                string[] zStrs = sects[3].Split(",");
+                    string[] sects = text.Split(";");
+                    if (sects.Length < 4)
+                        continue; // malformed packet
+
+                    string[] xStrs = sects[1].Split(",");
+                    string[] yStrs = sects[2].Split(",");
+                    string[] zStrs = sects[3].Split(",");
+
+                    xs = new float[xStrs.Length];
+                    ys = new float[xStrs.Length];
+                    zs = new float[xStrs.Length];
+                    for (int i = 0; i < xStrs.Length; i++)
+                    {
+                        xs[i] = float.Parse(xStrs[i]);
+                        ys[i] = float.Parse(yStrs[i]);
+                        zs[i] = float.Parse(zStrs[i]);
+                    }
+                    if (sects.Length > 5)
+                        ParseTextTargets(sects[5], targets);
+                }
+                if (xs.Length == 0)
+                    continue; // nothing predicted
 
                 lock (predictionLock)
                 {
@@ -269,16 +478,14 @@ public class ShooterPredictor : MonoBehaviour
                     predictedYList.Clear();
                     predictedZList.Clear();
 
-                    for (int i = 0; i < xStrs.Length; i++)
-                    {
-                        predictedXList.Add(float.Parse(xStrs[i]));
-                        predictedYList.Add(float.Parse(yStrs[i]));
-                        predictedZList.Add(float.Parse(zStrs[i]));
-                    }
+                    predictedXList.AddRange(xs);
+                    predictedYList.AddRange(ys);
+                    predictedZList.AddRange(zs);
 
                     predictedX = predictedXList.Last();
                     predictedY = predictedYList.Last();
                     predictedZ = predictedZList.Last();
+                    interceptTargets = targets;
                 }
 
                 if (showPath)
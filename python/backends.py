@@ -0,0 +1,153 @@
+# ----------------------------------------------------------------------------
+# backends.py
+# Chris McClurg
+#
+# This script loads the three LSTM predictors (mSel 5, 10, 20) behind a
+# common predict(xTest) call, so sed_pred does not care how they run:
+#
+#   keras   Keras model.predict (default)
+#   direct  model(x, training=False) inside a traced tf.function
+#   onnx    ONNX Runtime on CPU, from models exported with export_onnx
+#   stream  numpy LSTM advanced one row per frame per session (streaming.py)
+#
+# The backend is picked with the PREDICT_BACKEND environment variable.
+# LazyModels loads them on a background thread so predictions can start
+# (constant velocity) before TensorFlow is even imported.
+# ----------------------------------------------------------------------------
+
+import os
+import threading
+import numpy as np
+from history import CHANNELS, INPUTS
+
+MODEL_STEPS = [5, 10, 20]   # seconds of history per model (2 timesteps each)
+MODEL_DIR = os.path.join('.', 'dat', 'models')
+BACKENDS = ['keras', 'direct', 'onnx', 'stream']
+
+def model_path(mSel, ext='h5'):
+    '''file of the model that uses mSel seconds of history'''
+    return os.path.join(MODEL_DIR, f'sed{mSel}.{ext}')
+
+def model_input(xTest):
+    '''model inputs as float32; history keeps the grids as uint8 until here'''
+    return [np.asarray(elem, dtype=np.float32) for elem in xTest]
+
+def dummy_input(mSel, batch=1):
+    '''zero-filled model input for warm-up, shape (batch, nTS, features) per channel'''
+    return [np.zeros((batch, 2*mSel, CHANNELS[name][0]), dtype=np.float32) for name in INPUTS]
+
+class KerasBackend:
+    '''plain Keras model.predict'''
+
+    def __init__(self, model):
+        self.model = model
+
+    def predict(self, xTest):
+        return self.model.predict(model_input(xTest), verbose=0)
+
+class DirectBackend:
+    '''direct model call in a traced tf.function, skipping predict() overhead'''
+
+    def __init__(self, model):
+        import tensorflow as tf
+        self.model = model
+        self._call = tf.function(lambda x: model(x, training=False), reduce_retracing=True)
+
+    def predict(self, xTest):
+        return self._call(model_input(xTest)).numpy()
+
+class OnnxBackend:
+    '''ONNX Runtime CPU session'''
+
+    def __init__(self, path):
+        import onnxruntime as ort
+        self.session = ort.InferenceSession(path, providers=['CPUExecutionProvider'])
+        self._names = [elem.name for elem in self.session.get_inputs()]
+
+    def predict(self, xTest):
+        feed = dict(zip(self._names, model_input(xTest)))
+        return self.session.run(None, feed)[0]
+
+def export_onnx(mSel):
+    '''convert a saved Keras model to ONNX next to it (needs tf2onnx)'''
+
+    import tensorflow as tf
+    import tf2onnx
+    model = tf.keras.models.load_model(model_path(mSel), compile=False)
+    spec = [tf.TensorSpec((None, 2*mSel, CHANNELS[name][0]), tf.float32, name=name) for name in INPUTS]
+    tf2onnx.convert.from_keras(model, input_signature=spec, output_path=model_path(mSel, 'onnx'))
+    return model_path(mSel, 'onnx')
+
+def load_backend(mSel, backend):
+    '''load one model with the requested backend'''
+
+    if backend == 'onnx':
+        return OnnxBackend(model_path(mSel, 'onnx'))
+
+    import tensorflow as tf
+    model = tf.keras.models.load_model(model_path(mSel), compile=False)
+    if backend == 'direct':
+        return DirectBackend(model)
+    if backend == 'stream':
+        from streaming import from_keras
+        return from_keras(model, check=os.environ.get('PREDICT_STREAM_CHECK', '0') == '1')
+    return KerasBackend(model)
+
+def load_models(backend=None, warmup=2):
+    '''load the mSel 5/10/20 models and run warm-up passes'''
+
+    if backend is None:
+        backend = os.environ.get('PREDICT_BACKEND', 'keras')
+    if backend not in BACKENDS:
+        raise ValueError(f'unknown backend {backend}, expected one of {BACKENDS}')
+
+    models = []
+    for mSel in MODEL_STEPS:
+        model = load_backend(mSel, backend)
+        for _ in range(warmup):
+            model.predict(dummy_input(mSel))
+        models.append(model)
+    return models
+
+class LazyModels:
+    '''mSel 5/10/20 models filled in by a background thread as each one is warm'''
+
+    def __init__(self, backend=None, warmup=2):
+        self._models = [None for _ in MODEL_STEPS]
+        self.loaded = threading.Event()
+        self.error = None
+        self._thread = threading.Thread(target=self._load, args=(backend, warmup), daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        return len(self._models)
+
+    def __getitem__(self, index):
+        return self._models[index]
+
+    def __iter__(self):
+        return iter(list(self._models))
+
+    @property
+    def ready(self):
+        '''mSel of the models that can be used right now'''
+        return [mSel for mSel, model in zip(MODEL_STEPS, self._models) if model is not None]
+
+    def wait(self, timeout=None):
+        return self.loaded.wait(timeout)
+
+    def _load(self, backend, warmup):
+        if backend is None:
+            backend = os.environ.get('PREDICT_BACKEND', 'keras')
+        try:
+            for index, mSel in enumerate(MODEL_STEPS):
+                model = load_backend(mSel, backend)
+                for _ in range(warmup):
+                    model.predict(dummy_input(mSel))
+                self._models[index] = model     # swapped in for the next prediction
+                print(f'==> MODEL {mSel} LOADED')
+        except Exception as err:
+            self.error = err
+            print(f'==> MODEL LOADING FAILED ({err}), CONSTANT VELOCITY ONLY')
+        finally:
+            self.loaded.set()
@@ -0,0 +1,133 @@
+# ----------------------------------------------------------------------------
+# batching.py
+# Chris McClurg
+#
+# This script batches concurrent predictions for the same model. Requests
+# arriving within a short window (from several sessions, or from offline
+# evaluation threads) are stacked into one forward pass and the rows are
+# handed back to their callers. Each model is wrapped so sed_pred still
+# just calls model.predict(xTest) with a batch of one.
+# ----------------------------------------------------------------------------
+
+import time
+import queue
+import threading
+import numpy as np
+
+BATCH_WINDOW = 0.005    # seconds to wait for more requests after the first
+BATCH_MAX = 16          # largest batch sent to a model
+
+class Request:
+    '''one pending predict call'''
+
+    def __init__(self, xTest):
+        self.xTest = xTest
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+class BatchedModel:
+    '''stand-in for a model that routes predict() through the scheduler'''
+
+    def __init__(self, scheduler, index):
+        self.scheduler = scheduler
+        self.index = index
+
+    def predict(self, xTest):
+        return self.scheduler.predict(self.index, xTest)
+
+class BatchedModels(list):
+    '''batched stand-ins that report which wrapped models are loaded'''
+
+    def __init__(self, scheduler):
+        super().__init__(BatchedModel(scheduler, index) for index in range(len(scheduler._models)))
+        self.scheduler = scheduler
+
+    @property
+    def ready(self):
+        return getattr(self.scheduler._models, 'ready', None)
+
+class BatchScheduler:
+    '''micro-batching front end for the mSel 5/10/20 models'''
+
+    def __init__(self, models, window=BATCH_WINDOW, max_batch=BATCH_MAX):
+        self._models = models
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = [0 for _ in models]   # forward passes per model
+        self.requests = [0 for _ in models]  # predict calls per model
+
+        self._queues = [queue.Queue() for _ in models]
+        self._threads = []
+        for index in range(len(models)):
+            thread = threading.Thread(target=self._batch_loop, args=(index,), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def models(self):
+        '''batched stand-ins, in the same order as the wrapped models'''
+        return BatchedModels(self)
+
+    def predict(self, index, xTest):
+        '''queue a batch-of-one request and wait for its row of the output'''
+
+        request = Request(xTest)
+        self._queues[index].put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def close(self):
+        for pending in self._queues:
+            pending.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _collect(self, index):
+        '''first request plus whatever else arrives within the window'''
+
+        pending = self._queues[index]
+        first = pending.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = pending.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                pending.put(None)   # stop after this batch
+                break
+            batch.append(request)
+        return batch
+
+    def _batch_loop(self, index):
+        while True:
+            batch = self._collect(index)
+            if batch is None:
+                return
+
+            # stack each input channel along the batch axis, run once, split
+            # (looked up per batch, since models may be swapped in while serving)
+            try:
+                model = self._models[index]
+                num_input = len(batch[0].xTest)
+                xBatch = [np.concatenate([req.xTest[k] for req in batch]) for k in range(num_input)]
+                yBatch = model.predict(xBatch)
+                for row, request in enumerate(batch):
+                    request.result = yBatch[row:row+1]
+            except Exception as err:
+                for request in batch:
+                    request.error = err
+            finally:
+                self.batches[index] += 1
+                self.requests[index] += len(batch)
+                for request in batch:
+                    request.done.set()
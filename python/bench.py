@@ -0,0 +1,185 @@
+# ----------------------------------------------------------------------------
+# bench.py
+# Chris McClurg
+#
+# This script measures how the hot path scales with the number of NPCs and
+# doors and with the map size. For every combination it fabricates a school
+# and a run of frames (see synthetic.py), then times parsing (text and
+# binary), the wall window, the occupancy grids (per-object loop, batched
+# and incremental), visibility, the whole Featurizer step and predict. It
+# prints p50 latencies per scenario and the scaling exponent of each stage
+# (slope of log time over log NPC count). The report is written as JSON and
+# can be compared against an earlier one to catch regressions.
+#
+# usage: python bench.py [--npc 58 116 232 464] [--scale 1 2 4] [--frames 200]
+#                        [--backend cv] [--json out.json] [--compare old.json]
+# ----------------------------------------------------------------------------
+
+import sys
+import json
+import time
+import platform
+import argparse
+import numpy as np
+from wire import parse_frame
+from history import CHANNELS
+from pipeline import Featurizer, respond
+from occupancy import Occupancy
+from visibility import Visibility
+from synthetic import Scenario, encode_text, encode_binary
+from replay import load_replay_models, summarize
+from functions import transform, idx, get_walls, get_occupancy, get_occupancies, prepare_objects, merge_objects
+
+BASE_ROWS, BASE_COLS = 71, 131      # cells per floor at scale 1
+BASE_DO, BASE_DC = 17, 90           # doors at scale 1 (scaled with the floor area)
+STAGES = ['parse_text', 'parse_binary', 'walls', 'occupancy_loop', 'occupancy',
+          'occupancy_incremental', 'visibility', 'featurize', 'predict']
+TOLERANCE = 1.25        # p50 slowdown reported as a regression
+
+def chan_npc(sta_npc):
+    return np.where(sta_npc == 1, 0, np.where(sta_npc == 0, 1, -1))
+
+def bench_scenario(n_npc, scale, num_frames, models, seed=0):
+    '''time each stage over num_frames synthetic frames of one scenario'''
+
+    n_do, n_dc = BASE_DO*scale**2, BASE_DC*scale**2
+    scenario = Scenario(n_npc, n_do, n_dc, BASE_ROWS*scale, BASE_COLS*scale, seed=seed)
+    frames = scenario.frames(num_frames)
+    texts = [encode_text(frame) for frame in frames]
+    binaries = [encode_binary(frame) for frame in frames]
+    walls, obj_doors = scenario.walls(), scenario.obj_doors()
+    pos_do, pos_dc = scenario.pos_do.ravel(), scenario.pos_dc.ravel()
+    visibility = Visibility(scenario.layouts, obj_doors)
+    featurizer = Featurizer(walls, obj_doors, n_npc, n_do, n_dc)
+    occupancy = Occupancy(obj_doors)
+    wall_out = np.zeros(CHANNELS['wa'][0], dtype=np.uint8)
+    grid_outs = [np.zeros(CHANNELS['do'][0], dtype=np.uint8) for _ in range(4)]
+
+    times = {stage: [] for stage in STAGES}
+    start = time.perf_counter()
+    for frame, text, binary in zip(frames, texts, binaries):
+        px, py, pz = transform(*frame['shooter'][0:3])
+        pix, piy, piz = idx(px, py, pz)
+        cv_obj = np.concatenate([frame['vis_npc'], frame['vis_do'], frame['vis_dc']])
+        chan = chan_npc(frame['sta_npc'])
+
+        t0 = time.perf_counter()
+        parse_frame(text)
+        t1 = time.perf_counter()
+        parse_frame(binary)
+        t2 = time.perf_counter()
+        get_walls(pix, piy, piz, walls, wall_out)
+        t3 = time.perf_counter()
+        # the four per-object loops the original main ran: alive, dead, open, closed
+        pos_npc = frame['pos_npc'].ravel()
+        get_occupancy(px, py, piz, pos_npc, frame['vis_npc'], [], 1, 1, frame['sta_npc'])
+        get_occupancy(px, py, piz, pos_npc, frame['vis_npc'], [], 1, 0, frame['sta_npc'])
+        get_occupancy(px, py, piz, pos_do, frame['vis_do'], [], 1)
+        get_occupancy(px, py, piz, pos_dc, frame['vis_dc'], [], 1)
+        t4 = time.perf_counter()
+        objs = merge_objects(prepare_objects(frame['pos_npc'].ravel(), chan), obj_doors)
+        get_occupancies(px, py, piz, objs, cv_obj, grid_outs)
+        t5 = time.perf_counter()
+        occupancy.update(px, py, piz, frame['pos_npc'], chan, cv_obj, grid_outs)
+        t6 = time.perf_counter()
+        visibility.fill(dict(frame), px, py, piz, force=True)
+        t7 = time.perf_counter()
+        job = featurizer.step(frame)
+        job['inputs'] = featurizer.inputs()
+        t8 = time.perf_counter()
+        respond(models, job)
+        t9 = time.perf_counter()
+
+        for stage, t_start, t_end in zip(STAGES, [t0, t1, t2, t3, t4, t5, t6, t7, t8], [t1, t2, t3, t4, t5, t6, t7, t8, t9]):
+            times[stage].append(t_end - t_start)
+    report = summarize(times, num_frames, time.perf_counter() - start)
+    report.update({'n_npc': n_npc, 'n_do': n_do, 'n_dc': n_dc, 'scale': scale,
+                   'rows': BASE_ROWS*scale, 'cols': BASE_COLS*scale,
+                   'text_bytes': int(np.mean([len(xi) for xi in texts])),
+                   'binary_bytes': int(np.mean([len(xi) for xi in binaries]))})
+    return report
+
+def scaling(results):
+    '''per stage and map scale: slope of log p50 over log NPC count'''
+
+    ans = dict()
+    for scale in sorted(set(result['scale'] for result in results)):
+        rows = [result for result in results if result['scale'] == scale]
+        if len(rows) < 2:
+            continue
+        x = np.log([result['n_npc'] for result in rows])
+        ans[scale] = dict()
+        for stage in STAGES:
+            y = np.log([result['stages'][stage]['p50'] for result in rows])
+            ans[scale][stage] = float(np.polyfit(x, y, 1)[0])
+    return ans
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    '''(scenario, stage, old ms, new ms) for every p50 that slowed beyond the tolerance'''
+
+    old = {(result['n_npc'], result['scale']): result for result in baseline['results']}
+    ans = []
+    for result in results:
+        key = (result['n_npc'], result['scale'])
+        if key not in old:
+            continue
+        for stage, stats in result['stages'].items():
+            before = old[key]['stages'].get(stage)
+            if before is not None and stats['p50'] > tolerance*before['p50']:
+                ans.append((key, stage, before['p50'], stats['p50']))
+    return ans
+
+def print_report(report):
+    short = {'parse_text': 'text', 'parse_binary': 'binary', 'occupancy_loop': 'occ_loop', 'occupancy': 'occ',
+             'occupancy_incremental': 'occ_inc', 'visibility': 'vis', 'featurize': 'feat'}
+    names = [short.get(stage, stage) for stage in STAGES]
+    print('==> p50 latency (ms)')
+    print(f"    {'npc':>5} {'map':>8} " + ' '.join(f'{name:>8}' for name in names))
+    for result in report['results']:
+        size = f"{result['rows']}x{result['cols']}"
+        print(f"    {result['n_npc']:>5} {size:>8} " +
+              ' '.join(f"{result['stages'][stage]['p50']:8.3f}" for stage in STAGES))
+    for scale, slopes in report['scaling'].items():
+        print(f'==> scaling exponent over npc count (map scale {scale})')
+        print('    ' + '  '.join(f'{short.get(stage, stage)} {slope:.2f}' for stage, slope in slopes.items()))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='benchmark the hot path over npc counts and map sizes')
+    parser.add_argument('--npc', type=int, nargs='+', default=[58, 116, 232, 464])
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 2, 4], help='map side multiplier')
+    parser.add_argument('--frames', type=int, default=200, help='frames per scenario')
+    parser.add_argument('--backend', default='cv', help="keras, direct, onnx or cv (no models)")
+    parser.add_argument('--json', help='write the report to this file')
+    parser.add_argument('--compare', help='earlier report to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+
+    models = load_replay_models(args.backend)
+    results = []
+    for scale in args.scale:
+        for n_npc in args.npc:
+            results.append(bench_scenario(n_npc, scale, args.frames, models))
+            print(f'==> DONE {n_npc} npcs, map scale {scale}')
+
+    report = dict()
+    report['meta'] = {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+                      'backend': args.backend, 'frames': args.frames, 'time': time.strftime('%Y-%m-%d %H:%M:%S')}
+    report['results'] = results
+    report['scaling'] = scaling(results)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(report, json_file, indent=2)
+
+    # regressions against an earlier report (exit code 1 if any)
+    if args.compare:
+        with open(args.compare) as json_file:
+            slower = compare(results, json.load(json_file), args.tolerance)
+        for (n_npc, scale), stage, before, after in slower:
+            print(f'==> SLOWER {stage} ({n_npc} npcs, map scale {scale}): {before:.3f} -> {after:.3f} ms')
+        if len(slower) > 0:
+            sys.exit(1)
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# ----------------------------------------------------------------------------
+# cache.py
+# Chris McClurg
+#
+# This script remembers recent model outputs so repeated inputs skip the
+# LSTM. While the shooter stands still or moves slowly, consecutive frames
+# give the same walls, doors and NPC grids and nearly the same action window.
+# Actions arrive rounded to 0.1 grid units, so they are quantized to half a
+# cell (the scale the grids resolve) before hashing; windows whose steps all
+# round to the same half cell share an entry. The cached output is the relative trajectory (steps), so
+# convert_raw_pred re-anchors it at the current position as usual.
+# ----------------------------------------------------------------------------
+
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+CACHE_SIZE = 1024       # entries kept (least recently used dropped first)
+CACHE_QUANTUM = 0.5     # grid units the action window is rounded to (half a wall-grid cell)
+
+class CachedModel:
+    '''stand-in for a model that checks the cache before predict()'''
+
+    def __init__(self, cache, models, index):
+        self.cache = cache
+        self.models = models
+        self.index = index
+
+    def predict(self, xTest):
+        return self.cache.predict(self.index, self.models, xTest)
+
+class CachedModels(list):
+    '''cached stand-ins that report which wrapped models are loaded'''
+
+    def __init__(self, cache, models):
+        super().__init__(CachedModel(cache, models, index) for index in range(len(models)))
+        self.wrapped = models
+
+    @property
+    def ready(self):
+        return getattr(self.wrapped, 'ready', None)
+
+class PredictionCache:
+    '''bounded LRU of model outputs keyed on a hash of the model inputs'''
+
+    def __init__(self, max_size=CACHE_SIZE, quantum=CACHE_QUANTUM):
+        self.max_size = max_size
+        self.quantum = quantum
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def models(self, models):
+        '''cached stand-ins, in the same order as the wrapped models'''
+        return CachedModels(self, models)
+
+    def key(self, index, xTest):
+        '''hash of the model, quantized action window and exact grid channels'''
+
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(index.to_bytes(1, 'little'))
+        acs = np.asarray(xTest[0])
+        digest.update(str(acs.shape).encode())
+        digest.update(np.round(acs / self.quantum).astype(np.int32).tobytes())
+        for elem in xTest[1:]:
+            digest.update(np.ascontiguousarray(elem).tobytes())
+        return digest.digest()
+
+    def predict(self, index, models, xTest):
+        '''cached output for these inputs, or run the model and remember it'''
+
+        key = self.key(index, xTest)
+        with self._lock:
+            ans = self._entries.get(key)
+            if ans is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return ans.copy()
+            self.misses += 1
+
+        # looked up per call, since models may be swapped in while serving
+        ans = np.asarray(models[index].predict(xTest))
+        with self._lock:
+            self._entries[key] = ans.copy()
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return ans
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
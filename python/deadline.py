@@ -0,0 +1,75 @@
+# ----------------------------------------------------------------------------
+# deadline.py
+# Chris McClurg
+#
+# This script keeps running latency estimates per model and picks, for each
+# frame, the largest model expected to answer before the frame's deadline.
+# When the time already spent (queueing, featurizing) plus the estimate
+# would overrun, it steps down 20 -> 10 -> 5 -> constant velocity.
+# ----------------------------------------------------------------------------
+
+import threading
+
+DEADLINE = 0.05         # seconds from receiving a frame to having its prediction
+SMOOTHING = 0.2         # weight of the newest sample in the running estimates
+MARGIN = 2.0            # deviations added to the mean latency as headroom
+PROBE_EVERY = 50        # a skipped model is still tried once in this many frames
+
+class LatencyBudget:
+    '''per-model running latency estimates and a per-frame deadline'''
+
+    def __init__(self, deadline=DEADLINE, smoothing=SMOOTHING, margin=MARGIN, probe_every=PROBE_EVERY):
+        self.deadline = deadline
+        self.smoothing = smoothing
+        self.margin = margin
+        self.probe_every = probe_every
+        self._mean = dict()
+        self._dev = dict()
+        self._skipped = dict()
+        self._lock = threading.Lock()
+
+    def observe(self, mSel, seconds):
+        '''add one measured prediction time for a model'''
+
+        with self._lock:
+            if mSel not in self._mean:
+                self._mean[mSel] = seconds
+                self._dev[mSel] = 0.0
+                return
+            err = seconds - self._mean[mSel]
+            self._mean[mSel] += self.smoothing * err
+            self._dev[mSel] += self.smoothing * (abs(err) - self._dev[mSel])
+
+    def expected(self, mSel):
+        '''pessimistic latency estimate (s) of a model, None if never measured'''
+
+        with self._lock:
+            if mSel not in self._mean:
+                return None
+            return self._mean[mSel] + self.margin*self._dev[mSel]
+
+    def choose(self, mSel, elapsed=0.0, ready=None):
+        ''' largest model up to mSel expected to finish by the deadline (0: constant velocity)'''
+
+        for cand in [xi for xi in [20, 10, 5] if xi <= mSel]:
+            if ready is not None and cand not in ready:
+                continue
+            est = self.expected(cand)
+            if est is None or elapsed + est <= self.deadline:    # unmeasured models get a try
+                return cand
+
+            # now and then try a skipped model anyway, so its estimate can recover
+            with self._lock:
+                self._skipped[cand] = self._skipped.get(cand, 0) + 1
+                if self._skipped[cand] >= self.probe_every:
+                    self._skipped[cand] = 0
+                    return cand
+        return 0
+
+    def snapshot(self):
+        '''estimates in ms per model'''
+
+        # copied under the lock, as inference workers add models while metrics are read
+        with self._lock:
+            mean, dev = dict(self._mean), dict(self._dev)
+        return {mSel: round(1000*(mean[mSel] + self.margin*dev[mSel]), 3) for mSel in sorted(mean)}
@@ -0,0 +1,154 @@
+# ----------------------------------------------------------------------------
+# featurize.py
+# Chris McClurg
+#
+# This script regenerates model input channels from recorded sessions for
+# retraining. Sessions are shared out over a process pool; each worker
+# streams its frames from disk through the live Featurizer and writes one
+# compressed .npz per session (one row per frame for every channel, grid
+# channels bit-packed; load_features unpacks them). A manifest.csv lists what
+# was written.
+#
+# usage: python featurize.py <raw results dir> <out dir> [--workers 8] [--visibility]
+# ----------------------------------------------------------------------------
+
+import os
+import time
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from wire import parse_frame
+from recorder import INDEX_FILE, iter_frames
+from pipeline import Featurizer
+from visibility import Visibility
+from history import CHANNELS, is_grid, pack_rows, unpack_rows
+from functions import load_layouts, pad_layouts, load_door_objects
+from main import N_NPC, N_DO, N_DC
+
+MANIFEST_FILE = 'manifest.csv'
+MANIFEST_HEADER = 'session,file,frames,seconds\n'
+
+# per-worker static state, loaded once by init_worker
+_walls = None
+_obj_doors = None
+_visibility = None
+_recompute = False
+
+def is_session(path):
+    '''True for a directory holding a recorded session (segmented log or numbered dumps)'''
+    if os.path.exists(os.path.join(path, INDEX_FILE)):
+        return True
+    return any(os.path.splitext(xi)[0].isdigit() and os.path.isfile(os.path.join(path, xi))
+               for xi in os.listdir(path))
+
+def find_sessions(root):
+    '''session directories under root, relative to it, in sorted order'''
+
+    ans = []
+    for path, dirs, files in os.walk(root):
+        dirs.sort()
+        if is_session(path):
+            ans.append(os.path.relpath(path, root))
+            dirs[:] = []    # a session has no nested sessions
+    return ans
+
+def init_worker(walls, obj_doors, visibility=None, recompute=False):
+    global _walls, _obj_doors, _visibility, _recompute
+    _walls = walls
+    _obj_doors = obj_doors
+    _visibility = visibility
+    _recompute = recompute
+
+def featurize_session(path, walls, obj_doors, visibility=None, recompute=False):
+    '''stream one session through the Featurizer, collecting each frame's new rows'''
+
+    featurizer = Featurizer(walls, obj_doors, N_NPC, N_DO, N_DC, visibility, recompute)
+    rows = {name: [] for name in CHANNELS}
+    times = []
+    for data_in in iter_frames(path):
+        frame = parse_frame(data_in)
+        job = featurizer.step(frame)
+        # the rows just pushed (history length stays 0 when nothing is predicted ahead)
+        for name in CHANNELS:
+            rows[name].append(featurizer.rows[name].copy())
+        times.append((job['time_total'], frame['time_shoot'], job['time_ahead']))
+
+    # grids are 0/1, stored bit-packed (8 cells a byte) to keep files small
+    ans = dict()
+    for name, (width, dtype) in CHANNELS.items():
+        if is_grid(name):
+            ans[name] = pack_rows(np.array(rows[name], dtype=np.uint8).reshape(len(times), width))
+        else:
+            ans[name] = np.array(rows[name], dtype=np.float32).reshape(len(times), width)
+    ans['time'] = np.array(times, dtype=np.float32).reshape(len(times), 3)
+    return ans
+
+def load_features(path):
+    '''arrays of a featurized session (.npz), grid channels unpacked to uint8'''
+
+    with np.load(path) as data:
+        ans = {name: data[name] for name in data.files}
+    for name, (width, dtype) in CHANNELS.items():
+        if name in ans and is_grid(name):
+            ans[name] = unpack_rows(ans[name], width)
+    return ans
+
+def write_session(root, session, out_dir):
+    '''featurize root/session and save it as out_dir/session.npz (runs in a worker)'''
+
+    start = time.perf_counter()
+    arrays = featurize_session(os.path.join(root, session), _walls, _obj_doors, _visibility, _recompute)
+    out_file = os.path.join(out_dir, session + '.npz')
+    os.makedirs(os.path.dirname(out_file), exist_ok=True)
+    np.savez_compressed(out_file, **arrays)
+    return session, os.path.relpath(out_file, out_dir), len(arrays['time']), time.perf_counter() - start
+
+def featurize_all(root, out_dir, workers=None, walls=None, obj_doors=None, visibility=None, recompute=False):
+    '''featurize every session under root in parallel and write the manifest'''
+
+    if walls is None:
+        walls = pad_layouts(load_layouts())
+    if obj_doors is None:
+        obj_doors = load_door_objects()
+    if visibility is None:
+        visibility = Visibility(load_layouts(), obj_doors)
+    sessions = find_sessions(root)
+    os.makedirs(out_dir, exist_ok=True)
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(walls, obj_doors, visibility, recompute)) as pool:
+        futures = {pool.submit(write_session, root, session, out_dir): session for session in sessions}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as err:
+                print(f'==> FAILED {futures[future]} ({err})')
+                continue
+            print(f'==> FEATURIZED {result[0]} ({result[2]} frames, {result[3]:.1f} s)')
+            results.append(result)
+
+    # manifest in session order, whatever order the workers finished in
+    results.sort()
+    with open(os.path.join(out_dir, MANIFEST_FILE), 'w') as manifest:
+        manifest.write(MANIFEST_HEADER)
+        for session, file, frames, seconds in results:
+            manifest.write(f'{session},{file},{frames},{seconds:.3f}\n')
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='regenerate model input channels from recorded sessions')
+    parser.add_argument('root', help='directory searched for recorded sessions')
+    parser.add_argument('out', help='directory for the .npz files and manifest.csv')
+    parser.add_argument('--workers', type=int, default=None, help='processes (default: all cores)')
+    parser.add_argument('--visibility', action='store_true', help="recompute visibility instead of Unity's flags")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    results = featurize_all(args.root, args.out, args.workers, recompute=args.visibility)
+    frames = sum(result[2] for result in results)
+    print(f'==> {len(results)} sessions, {frames} frames in {time.perf_counter() - start:.1f} s')
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -6,11 +6,14 @@
 # -----------------------------------------------------------------------------
 
 import numpy as np
-import pandas as pd
 import os
+import hashlib
 from datetime import date, datetime
 
 DXY = 3
+LAYOUT_DIR = os.path.join('.', 'dat', 'visual', 'columbine')
+LAYOUT_CACHE = os.path.join(LAYOUT_DIR, 'cache')     # compiled .npy wall maps
+WALL_RADIUS = 10        # cells either side of the player in the wall window
 
 def transform(x_raw, y_raw, z_raw):
     '''convert raw Unity xyz to local simulation xyz'''
@@ -30,6 +33,25 @@ def transform(x_raw, y_raw, z_raw):
     z2 = z1
     return [x2, y2, z2]
 
+def transform_array(pos_raw):
+    '''convert raw Unity xyz rows (N, 3) to local simulation xyz (N, 3)'''
+
+    x0, y0, alpha = 240, 70, np.radians(35.5)
+    pos_raw = np.asarray(pos_raw, dtype=float).reshape(-1, 3)
+
+    #transform 1: raw to convenient
+    x1 = np.round((1620 - pos_raw[:,2])/3,1)
+    y1 = np.round(pos_raw[:,0]/3,1)
+    z1 = np.round(pos_raw[:,1]/3,1)
+
+    #transform 2: convenient to local box
+    dx = x1 - x0
+    dy = y1 - y0
+    x2 = np.round(dx * np.cos(alpha) + dy * np.sin(alpha),1)
+    y2 = np.round(-dx * np.sin(alpha) + dy * np.cos(alpha),1)
+    z2 = z1
+    return np.stack([x2, y2, z2], axis=1)
+
 def inverse_transform(x2, y2, z2):
     '''convert local simulation xyz back to raw Unity xyz'''
     
@@ -48,6 +70,23 @@ def inverse_transform(x2, y2, z2):
     y_raw = np.round(z1*3,1)
     return x_raw, y_raw, z_raw
 
+def inverse_transform_array(pos):
+    '''convert local simulation xyz rows (..., 3) back to raw Unity xyz (..., 3)'''
+
+    x0, y0, alpha = 240, 70, np.radians(35.5)
+    pos = np.asarray(pos, dtype=float)
+
+    #transform 1: local box to convenient (rotation applied to all rows at once)
+    rot = np.array([[np.cos(alpha), np.sin(alpha)], [-np.sin(alpha), np.cos(alpha)]])
+    xy1 = pos[...,:2] @ rot + [x0, y0]
+    z1 = pos[...,2]
+
+    #transform 2: convenient to raw
+    z_raw = np.round((1620 - xy1[...,0]*3),1)
+    x_raw = np.round(xy1[...,1]*3,1)
+    y_raw = np.round(z1*3,1)
+    return np.stack([x_raw, y_raw, z_raw], axis=-1)
+
 def idx(x, y, z):
     '''discretize xyz into grid cell indices'''
     
@@ -64,6 +103,13 @@ def idx(x, y, z):
             z_bar = 2
     return x_bar, y_bar, z_bar
 
+def idx_floor(x, z):
+    '''discretize arrays of local xz into floor indices (0 where undefined)'''
+
+    z_bar = np.where(np.asarray(z) < 10, 1, 2)
+    z_bar[np.isnan(x)] = 0
+    return z_bar
+
 def inverse_idx(x_bar, y_bar, z_bar):
     '''grid cell indices to continuous xyz'''
     
@@ -91,83 +137,89 @@ def moving_avg(xList, yList, zList, window_size = 7):
     zmaList = np.convolve(zPad, np.ones(window_size,)/window_size, mode = 'valid')
     return [xmaList, ymaList, zmaList]
 
-def load_layouts():
-    '''load binary wall maps for each floor from excel files'''
-    
-    # read file 1
-    file_1 = os.path.join('.', 'dat', 'visual', 'columbine', 'map1.xlsx')
-    layout1 = pd.read_excel(file_1, header = None)
-    layout1 = layout1.values
-    layout1 = np.array(layout1).astype(int)
-    layout1[layout1!=1]=0
-
-    # read file 2
-    file_2 = os.path.join('.', 'dat', 'visual', 'columbine', 'map2.xlsx')
-    layout2 = pd.read_excel(file_2, header = None)
-    layout2 = layout2.values
-    layout2 = np.array(layout2).astype(int)
-    layout2[layout2!=1]=0
+def read_layout(path):
+    '''read one binary wall map from an excel file (needs pandas)'''
+
+    import pandas as pd
+    layout = pd.read_excel(path, header = None)
+    layout = layout.values
+    layout = np.array(layout).astype(int)
+    layout[layout!=1]=0
+    return layout
+
+def file_hash(path):
+    '''sha1 of a file's bytes, used to tell when a cache is stale'''
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def load_layout(path, cache_dir):
+    '''load one wall map from its compiled .npy cache, rebuilding it if the excel file changed'''
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    cache_file = os.path.join(cache_dir, f'{name}.npy')
+    hash_file = os.path.join(cache_dir, f'{name}.sha1')
+
+    # use the cache if it was built from this exact source (or the source is gone)
+    source_hash = file_hash(path) if os.path.exists(path) else None
+    if os.path.exists(cache_file) and os.path.exists(hash_file):
+        with open(hash_file) as f:
+            cached_hash = f.read().strip()
+        if source_hash is None or cached_hash == source_hash:
+            return np.load(cache_file, mmap_mode='r')
+
+    # otherwise read the excel file once and write the cache next to it
+    layout = read_layout(path).astype(np.uint8)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_file = os.path.join(cache_dir, f'{name}.tmp.npy')
+    np.save(tmp_file, layout)
+    os.replace(tmp_file, cache_file)
+    with open(hash_file, 'w') as f:
+        f.write(source_hash)
+    return np.load(cache_file, mmap_mode='r')
+
+def load_layouts(cache=True):
+    '''load binary wall maps for each floor (compiled cache, or excel files)'''
     
     ans = dict()
-    ans['layout1'] = layout1
-    ans['layout2'] = layout2
+    for floor in [1, 2]:
+        path = os.path.join(LAYOUT_DIR, f'map{floor}.xlsx')
+        if cache:
+            ans[f'layout{floor}'] = load_layout(path, LAYOUT_CACHE)
+        else:
+            ans[f'layout{floor}'] = read_layout(path)
     return ans
 
-def get_walls(pix, piy, piz, full_layout, wa, num_step):
-    '''extract a local 21×21 wall grid centered on the player'''
-
-    # get correct floor
-    full = full_layout[f'layout{piz}'].copy()
-
-    grid_size = 21
-    ctr = int((grid_size - 1)/2)
-    ans = np.zeros((grid_size, grid_size))
-    if any([pix < 0, piy < 0, pix > 130, piy > 70]):
-        wa.append(ans)
+def pad_layouts(full_layout, radius=WALL_RADIUS):
+    '''pad each floor with empty cells once, so any wall window is a plain slice'''
+    return {name: np.pad(np.asarray(layout), radius) for name, layout in full_layout.items()}
 
-    else:
-        full_shape, pos, ans_shape = np.array(full.shape), np.array([piy-ctr, pix-ctr]), np.array(ans.shape)
-        end = pos + ans_shape
-
-        #Calculate crop position
-        ans_low = np.clip(0 - pos, 0, ans_shape)
-        ans_high = ans_shape - np.clip(end-full_shape, 0, ans_shape)
-        ans_slices = (slice(low, high) for low, high in zip(ans_low, ans_high))
+def get_walls(pix, piy, piz, walls, out, radius=WALL_RADIUS):
+    '''copy the local 21×21 wall grid centered on the player into out (walls from pad_layouts)'''
 
-        # Calculate img slice positions
-        pos = np.clip(pos, 0, full_shape)
-        end = np.clip(end, 0, full_shape)
-        full_slices = (slice(low, high) for low, high in zip(pos, end))
-        ans[tuple(ans_slices)] = full[tuple(full_slices)]
+    grid_size = 2*radius + 1
+    ans = out.reshape(grid_size, grid_size)
+    padded = walls[f'layout{piz}']
+    rows, cols = padded.shape[0] - 2*radius, padded.shape[1] - 2*radius
+    if any([pix < 0, piy < 0, pix >= cols, piy >= rows]):
+        ans[:] = 0
+        return out
 
-        wa.append(ans)
+    # window around (piy, pix) starts at (piy, pix) in the padded map
+    ans[:] = padded[piy:piy+grid_size, pix:pix+grid_size]
+    return out
 
-    # limit length of history
-    if len(wa) == (num_step + 1):
-        wa = wa[1:]
-    return wa
+def get_steps(px, py, prev_pos, out):
+    ''' compute the xy movement delta for this timestep in grid units into out'''
 
-def get_steps(px, py, ac_list, px_list, py_list, num_step):
-    ''' compute the xy movement deltas per timestep in grid units'''
-    px_list.append(px)
-    py_list.append(py)
-
-    if len(px_list) == 1:
+    if prev_pos is None:
         dx = 0.0
         dy = 0.0
     else:
-        dx = np.round((px_list[-1]-px_list[-2]) / 3,1)  # grid units
-        dy = np.round((py_list[-1]-py_list[-2]) / 3,1)  # grid units
-
-    step = np.array([dx,dy])
-    ac_list.append(step)
+        dx = np.round((px-prev_pos[0]) / 3,1)  # grid units
+        dy = np.round((py-prev_pos[1]) / 3,1)  # grid units
 
-    # limit length of history for memory
-    if len(px_list) == (num_step + 1):
-        px_list = px_list[1:]
-        py_list = py_list[1:]
-        ac_list = ac_list[1:]
-    return ac_list, px_list, py_list
+    out[:] = [dx, dy]
+    return out
 
 def get_theta(x,y,px,py):
     ''' compute angle from shooter to object in [0, 2pi]'''
@@ -204,6 +256,29 @@ def to_radial_coords(x, y, px, py):
     else:
         return (int(rstep),int(tstep))
 
+def to_radial_bins(x, y, px, py):
+    ''' place arrays of objects into discrete polar bins (r, theta)'''
+
+    num_theta = 20
+    num_radii = 20
+    radii_max = 100
+
+    theta_step = 2*np.pi / num_theta
+    radii_step = radii_max / num_radii
+
+    radius = np.sqrt((x - px)**2 + (y - py)**2)
+    theta = np.arctan2(y - py, x - px)
+    theta = np.where(theta < 0.0, 2*np.pi + theta, theta)
+
+    rstep = np.floor(radius / radii_step)
+    tstep = np.floor(theta / theta_step)
+
+    # objects beyond the outer ring are flagged with -1
+    inside = rstep < num_radii
+    rbin = np.where(inside, rstep, -1).astype(int)
+    tbin = np.where(inside, tstep, -1).astype(int)
+    return rbin, tbin
+
 def get_occupancy(px, py, piz, obj_pos, cv_obj, obj_list, num_step, spec=None, spec_list=None):
     ''' constructs the polar occupancy grid for npcs or doors'''
     
@@ -213,7 +288,7 @@ def get_occupancy(px, py, piz, obj_pos, cv_obj, obj_list, num_step, spec=None, s
     # resultant grid
     num_theta = 20
     num_radii = 20
-    obj = np.zeros((num_radii, num_theta), dtype = int)
+    obj = np.zeros((num_radii, num_theta), dtype = np.uint8)
 
     # update current timestep occupancy grid
     for i in range(len(cv_obj)):
@@ -247,6 +322,44 @@ def get_occupancy(px, py, piz, obj_pos, cv_obj, obj_list, num_step, spec=None, s
 
     return obj_list
 
+def prepare_objects(obj_pos, obj_chan):
+    ''' convert raw object positions to local xy, floor index and channel'''
+
+    pos = transform_array(obj_pos)
+    ans = dict()
+    ans['xy'] = pos[:,0:2]
+    ans['iz'] = idx_floor(pos[:,0], pos[:,2])
+    ans['chan'] = np.broadcast_to(obj_chan, len(pos)).astype(int)
+    return ans
+
+def merge_objects(*objs):
+    ''' concatenate prepared object sets into one'''
+
+    ans = dict()
+    for key in ['xy', 'iz', 'chan']:
+        ans[key] = np.concatenate([obj[key] for obj in objs])
+    return ans
+
+def get_occupancies(px, py, piz, objs, cv_obj, outs):
+    ''' constructs the polar occupancy grids for all channels in one pass into outs'''
+
+    # resultant grids, one flattened row per channel
+    num_theta = 20
+
+    # keep objects that were seen, have a channel and share the floor
+    xy, chan = objs['xy'], objs['chan']
+    keep = (np.asarray(cv_obj) == 1) & (chan >= 0) & (objs['iz'] == piz)
+
+    # bin all remaining objects at once
+    ri, ti = to_radial_bins(xy[keep,0], xy[keep,1], px, py)
+    inside = ri >= 0
+    cell = ri[inside]*num_theta + ti[inside]
+    chan = chan[keep][inside]
+    for ic, out in enumerate(outs):
+        out[:] = 0
+        out[cell[chan == ic]] = 1
+    return outs
+
 def load_door_pos():
     '''load Unity door positions (static)'''
 
@@ -258,15 +371,20 @@ def load_door_pos():
     pos_dc      = [float(xi) for xi in pos_dc.strip().split(',') if len(xi) > 0]
     return pos_do, pos_dc
 
+def load_door_objects():
+    '''load static doors, transformed once (channels 2 open and 3 closed)'''
+
+    pos_do, pos_dc = load_door_pos()
+    return merge_objects(prepare_objects(pos_do, 2), prepare_objects(pos_dc, 3))
+
 def convert_raw_pred(raw_pred, px, py):
-    '''convert raw delta index values to Python xy values'''
-    dx = [xi*DXY for xi in raw_pred[:,0]]
-    dy = [xi*DXY for xi in raw_pred[:,1]]
-    cummDx = [np.sum(dx[:ix]) for ix in range(1,len(dx)+1)]
-    cummDy = [np.sum(dy[:iy]) for iy in range(1,len(dy)+1)]
-    xAns = [(xi + px) for xi in cummDx]
-    yAns = [(yi + py) for yi in cummDy]
-    return list(zip(xAns, yAns))
+    '''convert raw delta index values (..., T, 2) to Python xy values (..., T, 2)'''
+
+    raw_pred = np.asarray(raw_pred, dtype=float)
+    if raw_pred.ndim == 1:
+        raw_pred = raw_pred.reshape(-1, 2)
+    cumm = np.cumsum(raw_pred*DXY, axis=-2)
+    return cumm + np.stack([px, py], axis=-1)[...,None,:]
 
 def cv_pred(acs, pred_time):
     '''constant-velocity predictor using recent actions.'''
@@ -291,99 +409,76 @@ def cv_pred(acs, pred_time):
     raw_pred = np.array(raw_pred)
     return raw_pred
 
-def sed_pred(model, acs, was, dos, dcs, nas, nds, mSel):
+def sed_pred(model, acs, was, dos, dcs, nas, nds, mSel, stream=None):
     '''run the LSTM predictor with numerous inputs'''
     
-    # truncate copies
-    acs_temp = acs.copy()[-(mSel*2):]
-    was_temp = was.copy()[-(mSel*2):]
-    dos_temp = dos.copy()[-(mSel*2):]
-    dcs_temp = dcs.copy()[-(mSel*2):]
-    nas_temp = nas.copy()[-(mSel*2):]
-    nds_temp = nds.copy()[-(mSel*2):]
-
-    # vectorize elements
-    num_theta = 20
-    num_radii = 20
-    grid_size = 21
-    acs_temp = np.array(acs_temp)                                                 # (nTS, 2)
-    was_temp = np.array([np.reshape(elem, grid_size**2) for elem in was_temp])    # (nTS, 441)
-    dos_temp = np.array([np.reshape(elem, num_radii*num_theta) for elem in dos_temp]) # (nTS, 400)
-    dcs_temp = np.array([np.reshape(elem, num_radii*num_theta) for elem in dcs_temp]) # (nTS, 400)
-    nas_temp = np.array([np.reshape(elem, num_radii*num_theta) for elem in nas_temp]) # (nTS, 400)
-    nds_temp = np.array([np.reshape(elem, num_radii*num_theta) for elem in nds_temp]) # (nTS, 400)
-
-    # expand vectors
-    xTest0 = np.expand_dims(acs_temp, 0)   # (None, nTS, 2)
-    xTest1 = np.expand_dims(was_temp, 0)   # (None, nTS, 441)
-    xTest2 = np.expand_dims(dos_temp, 0)   # (None, nTS, 400)
-    xTest3 = np.expand_dims(dcs_temp, 0)   # (None, nTS, 400)
-    xTest4 = np.expand_dims(nas_temp, 0)   # (None, nTS, 400)
-    xTest5 = np.expand_dims(nds_temp, 0)   # (None, nTS, 400)
-
-    # combine input
-    xTest = [xTest0, xTest1, xTest2, xTest3, xTest4, xTest5]
-
-    # make inference
-    raw_pred = np.squeeze(model.predict(xTest))
+    # window of the last 2*mSel timesteps, shape (None, nTS, features)
+    nTS = mSel*2
+    xTest = [np.expand_dims(elem[-nTS:], 0) for elem in [acs, was, dos, dcs, nas, nds]]
+
+    # make inference (any backend from backends.py; streaming ones keep state per stream)
+    if stream is not None and hasattr(model, 'predict_stream'):
+        raw_pred = np.squeeze(model.predict_stream(*stream, xTest))
+    else:
+        raw_pred = np.squeeze(model.predict(xTest))
     return raw_pred
 
-def predict(models, px, py, acs, was, dos, dcs, nas, nds, pred_time):
-    ''' predict future shooter xy with approriate model'''
+def select_model(num_dat, pred_time, ready=None):
+    ''' pick the model (0 for constant velocity) for the history length and horizon'''
 
-    num_dat = len(acs) # int up to 40 timesteps
-    num_cap = [xi for xi in [0,5,10,20] if num_dat>=2*xi]
+    # ready lists the loaded models (None: all of them)
+    num_cap = [xi for xi in [0,5,10,20] if num_dat>=2*xi and (xi==0 or ready is None or xi in ready)]
     ix_sel = np.argmin(np.array([np.abs(pred_time - xi) for xi in num_cap]))
-    mSel = num_cap[ix_sel]
+    return num_cap[ix_sel]
+
+def predict(models, px, py, acs, was, dos, dcs, nas, nds, pred_time, mSel=None, stream=None):
+    ''' predict future shooter xy with approriate model'''
+
+    if mSel is None:
+        mSel = select_model(len(acs), pred_time) # history of up to 40 timesteps
     
     #raw prediction
     if mSel == 0:      
         raw_pred = cv_pred(acs, pred_time)  # constant velocity
     elif mSel == 5:    
-        raw_pred = sed_pred(models[0], acs, was, dos, dcs, nas, nds, 5) # LSTM
+        raw_pred = sed_pred(models[0], acs, was, dos, dcs, nas, nds, 5, stream) # LSTM
     elif mSel == 10:
-        raw_pred = sed_pred(models[1], acs, was, dos, dcs, nas, nds, 10) # LSTM
+        raw_pred = sed_pred(models[1], acs, was, dos, dcs, nas, nds, 10, stream) # LSTM
     else:
-        raw_pred = sed_pred(models[2], acs, was, dos, dcs, nas, nds, 20) # LSTM
+        raw_pred = sed_pred(models[2], acs, was, dos, dcs, nas, nds, 20, stream) # LSTM
     
     # convert raw prediction
     xy_pred = convert_raw_pred(raw_pred, px, py)
     return xy_pred
 
 def python_to_unity(xy_pred, pz):
-    '''convert Python xyz to Unity xyz'''
-    
-    x_unity = []
-    y_unity = []
-    z_unity = []
-    xPython = [xi[0] for xi in xy_pred]
-    yPython = [xi[1] for xi in xy_pred]
-    for i in range(len(xPython)):
-        xTemp, yTemp, zTemp = inverse_transform(xPython[i], yPython[i], pz)
-        x_unity.append(xTemp)
-        y_unity.append(yTemp)
-        z_unity.append(zTemp)
-    return x_unity, y_unity, z_unity
-
-def unity_to_string(t, x_unity, y_unity, z_unity):
-    '''format predictions into comma separated string'''
-    
-    ans = f'{t};'
-    for x in x_unity:
-        ans += f'{x},'
-    ans = ans[:-1]
-    ans += ';'
-    for y in y_unity:
-        ans += f'{y},'
-    ans = ans[:-1]
-    ans += ';'
-    for z in z_unity:
-        ans += f'{z},'
-    ans = ans[:-1]
-    return ans
+    '''convert Python xy (..., T, 2) at height pz to Unity x, y, z arrays (..., T)'''
+
+    xy_pred = np.asarray(xy_pred, dtype=float)
+    z = np.broadcast_to(np.asarray(pz, dtype=float)[...,None], xy_pred.shape[:-1])
+    pos = inverse_transform_array(np.concatenate([xy_pred, z[...,None]], axis=-1))
+    return pos[...,0], pos[...,1], pos[...,2]
+
+def unity_to_string(t, x_unity, y_unity, z_unity, mSel=None, wanted=None, targets=None):
+    '''format predictions (and optionally the model used/wanted, then robot targets) into comma separated string'''
+
+    # one join per axis (floats print as before, e.g. 518.9)
+    axes = [','.join(map(str, np.asarray(elem, dtype=float).tolist())) for elem in [x_unity, y_unity, z_unity]]
+    if mSel is not None:
+        axes.append(f'{mSel},{mSel if wanted is None else wanted}')
+        if targets is not None:
+            axes.append(','.join(f'{ix},{round(x, 1)},{round(y, 1)},{round(z, 1)}' for ix, x, y, z in targets))
+    return ';'.join([f'{t}'] + axes)
+
+def station_setting(name, station=None):
+    '''setting of one station: <name>_<station id> if set, else the process-wide <name>'''
 
-def make_write_dir():
-    '''create results directories for this participant'''
+    if station is not None and f'{name}_{station}' in os.environ:
+        return os.environ[f'{name}_{station}']
+    return os.environ[name]
+
+def make_write_dir(session=None, addr=None):
+    '''create results directories for this participant (of a session and station, if given)'''
 
     # results (main)
     path = "D:/chris/projects/shooter-hri/results"
@@ -423,28 +518,21 @@ def make_write_dir():
     currentTime = datetime.now()
     strDate = currentTime.strftime('%m/%d/%y')
     strTime = currentTime.strftime('%I:%M %p')
-    pinits = os.environ["PARTICIPANT"]
+    # sessions with an id read their station's settings (e.g. PARTICIPANT_2)
+    station = session if isinstance(session, int) else None
+    pinits = station_setting("PARTICIPANT", station)
     info =  f"Participant:\t{pinits}\n"
     info += (f"Date: \t\t{strDate}\n")
     info += (f"Time: \t\t{strTime}\n")
-    info += ("Robot Enabled: \t" + os.environ["ROBOT_IS_ENABLED"] + "\n")
-    info += ("Distracting: \t" + os.environ["ROBOT_IS_DISTRACTING"] + "\n")
-    info += ("Aggressive: \t" + os.environ["ROBOT_IS_AGGRESSIVE"] + "\n")
-    info += ("Fog Enabled: \t" + os.environ["ROBOT_FOG_ENABLED"] + "\n")
+    info += ("Robot Enabled: \t" + station_setting("ROBOT_IS_ENABLED", station) + "\n")
+    info += ("Distracting: \t" + station_setting("ROBOT_IS_DISTRACTING", station) + "\n")
+    info += ("Aggressive: \t" + station_setting("ROBOT_IS_AGGRESSIVE", station) + "\n")
+    info += ("Fog Enabled: \t" + station_setting("ROBOT_FOG_ENABLED", station) + "\n")
+    if station is not None:
+        info += (f"Session: \t{station}\n")
+    if addr is not None:
+        info += (f"Station: \t{addr[0]}:{addr[1]}\n")
     with open(filepath, "w") as text_file:
         text_file.write(info)
 
     return dir_pno
-
-def dump_data(tShoot, path, data_in):
-    '''save raw input from Unity to file.'''
-    
-    if (tShoot > 0):
-        print(f"==> DATA DUMPED ({tShoot})")
-        nFile = len(next(os.walk(path))[2])
-        filepath = os.path.join(path, f'{nFile}.txt')
-        with open(filepath, "w") as text_file:
-            text_file.write(data_in)
-    else:
-        print("==> DATA NOT RECORDED.")
-    return
\ No newline at end of file
@@ -0,0 +1,93 @@
+# ----------------------------------------------------------------------------
+# history.py
+# Chris McClurg
+#
+# This script defines the fixed-size history buffers used by main.py. Grid
+# channels are 0/1 and kept as uint8; they become float32 only when a batch
+# is handed to a model (see backends.model_input), and are bit-packed on disk.
+# ----------------------------------------------------------------------------
+
+import numpy as np
+
+MAX_STEPS = 40          # longest window any model needs (mSel 20 -> 40 steps)
+
+# channel name -> (features per timestep, dtype)
+CHANNELS = {
+    'pos': (2, float),      # shooter position, x and y
+    'ac':  (2, float),      # actions (xy deltas in grid units)
+    'wa':  (21*21, np.uint8),   # local wall grid
+    'do':  (20*20, np.uint8),   # open door polar grid
+    'dc':  (20*20, np.uint8),   # closed door polar grid
+    'na':  (20*20, np.uint8),   # alive npc polar grid
+    'nd':  (20*20, np.uint8),   # dead npc polar grid
+}
+INPUTS = ['ac', 'wa', 'do', 'dc', 'na', 'nd']   # model input channels, in order
+
+def is_grid(name):
+    '''True for the 0/1 grid channels'''
+    return np.dtype(CHANNELS[name][1]) == np.uint8
+
+def pack_rows(rows):
+    '''0/1 rows (..., width) -> bit-packed uint8 (..., ceil(width/8))'''
+    return np.packbits(np.asarray(rows) != 0, axis=-1)
+
+def unpack_rows(packed, width):
+    '''bit-packed rows back to 0/1 uint8 (..., width)'''
+    return np.unpackbits(packed, axis=-1, count=width)
+
+class History:
+    '''per-channel ring buffers that hand out contiguous windowed views'''
+
+    def __init__(self, max_steps=MAX_STEPS, channels=None):
+        if channels is None:
+            channels = CHANNELS
+
+        # twice the capacity, so the newest rows are always contiguous
+        self.max_steps = max_steps
+        self.length = 0
+        self.steps = 0          # timesteps pushed so far (never trimmed)
+        self._end = 0
+        self._buf = dict()
+        for name, (num, dtype) in channels.items():
+            self._buf[name] = np.zeros((2*max_steps, num), dtype = dtype)
+
+    def __len__(self):
+        return self.length
+
+    def push(self, num_step):
+        '''advance one timestep and return zeroed rows to fill in place'''
+
+        # buffer full: slide the newest rows back to the front
+        if self._end == 2*self.max_steps:
+            keep = self.max_steps - 1
+            for buf in self._buf.values():
+                buf[:keep] = buf[self._end-keep:self._end]
+            self._end = keep
+
+        rows = dict()
+        for name, buf in self._buf.items():
+            rows[name] = buf[self._end]
+            rows[name][:] = 0
+        self._end += 1
+
+        # limit length of history (same rule as the old list trimming)
+        self.steps += 1
+        self.length += 1
+        if self.length == (num_step + 1):
+            self.length -= 1
+        self.length = min(self.length, self.max_steps)
+        return rows
+
+    def window(self, name, num=None):
+        '''view of the last num timesteps of a channel, oldest first'''
+
+        if num is None or num > self.length:
+            num = self.length
+        return self._buf[name][self._end-num:self._end]
+
+    def last(self, name):
+        '''copy of the newest row of a channel, or None if empty'''
+
+        if self.length == 0:
+            return None
+        return self._buf[name][self._end-1].copy()
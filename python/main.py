@@ -5,23 +5,22 @@
 # This script communicates with Unity to predict the shooter's next positions. 
 # ----------------------------------------------------------------------------
 
-import udp
-import time
-import numpy as np
+import os
+from wire import Comms
+from session import Sessions
+from runtime import Runtime
+from backends import load_models, LazyModels
+from batching import BatchScheduler
+from cache import PredictionCache
+from deadline import LatencyBudget
+from visibility import Visibility
+from routing import Router
+from metrics import Metrics, serve_metrics, log_metrics
 from functions import (
-    transform,
-    idx,
     load_layouts,
-    load_models,
-    load_door_pos,
+    pad_layouts,
+    load_door_objects,
     make_write_dir,
-    dump_data,
-    get_steps,
-    get_walls,
-    get_occupancy,
-    predict,
-    python_to_unity,
-    unity_to_string,
 )
 
 
@@ -29,155 +28,102 @@ from functions import (
 N_NPC = 116             # number of NPCs in the environment
 N_DO = 17               # number of open doors in the environment
 N_DC = 90               # number of closed doors in the environment
-TIMEOUT_WARN1 = 5.0     # wait time before first warning
-TIMEOUT_WARN2 = 8.0     # wait tume before second warning
-TIMEOUT_END   = 10.0    # wait time before ending script
 
-def run():
+def run(serve=None):
     '''This real-time loop exchanges data with Unity to predicting shooter motion'''
 
+    # server mode: several Unity clients, each reply goes back to its sender
+    if serve is None:
+        serve = os.environ.get('PREDICT_SERVE', '0') == '1'
+
+    # fast start: answer with constant velocity while the models load
+    fast_start = os.environ.get('PREDICT_FAST_START', '0') == '1'
+
     # create socket
-    sock = udp.comms(udpIP="127.0.0.1", portTX=8000, portRX=8001, 
-                     enableRX=True, suppressWarnings=True)
+    host = os.environ.get('PREDICT_HOST', '0.0.0.0') if serve else "127.0.0.1"
+    sock = Comms(udpIP=host, portTX=8000, portRX=8001)
     print('==> SOCKET STARTED')
     
     # load files
-    full_layout = load_layouts()
+    layouts = load_layouts()
+    walls = pad_layouts(layouts)
     print('==> LAYOUTS LOADED')
     
-    # load prediction models
-    models = load_models()
-    print('==> MODELS LOADED')
-    
-    # load static doors
-    pos_do, pos_dc = load_door_pos()
+    # load prediction models (in the background with fast start)
+    if fast_start:
+        models = LazyModels()
+        print('==> MODELS LOADING (CONSTANT VELOCITY UNTIL READY)')
+    else:
+        models = load_models()
+        print('==> MODELS LOADED')
+
+    # optionally batch concurrent predictions (window in ms, 0 disables);
+    # streaming models keep per-session state, so they are never batched or cached
+    stream = os.environ.get('PREDICT_BACKEND') == 'stream'
+    window = float(os.environ.get('PREDICT_BATCH_WINDOW', '5' if serve else '0')) / 1000
+    workers = int(os.environ.get('PREDICT_WORKERS', '4' if serve else '1'))
+    if window > 0 and not stream:
+        scheduler = BatchScheduler(models, window)
+        models = scheduler.models()
+
+    # optionally reuse outputs for repeated inputs (entries, 0 disables)
+    cache = None
+    cache_size = int(os.environ.get('PREDICT_CACHE_SIZE', '0'))
+    if cache_size > 0 and not stream:
+        cache = PredictionCache(cache_size)
+        models = cache.models(models)
+    
+    # optionally trade model size for time: deadline in ms from receipt (0 disables)
+    budget = None
+    deadline = float(os.environ.get('PREDICT_DEADLINE_MS', '0')) / 1000
+    if deadline > 0:
+        budget = LatencyBudget(deadline)
+    
+    # load static doors (transformed once)
+    obj_doors = load_door_objects()
     print('==> STATIC OBJECTS LOADED')
-    
-    # initialize history buffers
-    pxs, pys = [], []  # shooter positions, x and y
-    acs, was = [], []  # actions and walls
-    nas, nds = [], []  # alive and dead npcs
-    dos, dcs = [], []  # open and closed doors
-    
-    # initialize cumulative visibility
-    cv_npc  = np.array([0 for xi in range(N_NPC)])  # npcs
-    cv_do   = np.array([0 for xi in range(N_DO)])   # open doors
-    cv_dc   = np.array([0 for xi in range(N_DC)])   # closed doors
-    
-    # initialize flags
-    last_msg_time         = time.time()  # time of last message
-    _is_running     = True
-    _has_started    = False
-    _first_warning  = False
-    _second_warning = False
-    
-    # create write directory / wait until signal received
-    write_dir = make_write_dir()
+
+    # line of sight on the wall grid, used for frames sent without visibility;
+    # 'python' recomputes every frame's flags, 'cache' also precomputes the doors
+    mode = os.environ.get('PREDICT_VISIBILITY', 'unity')
+    visibility = Visibility(layouts, obj_doors, cache=(mode == 'cache'))
+
+    # robot intercept points on the wall grid, sent with each reply (0 disables)
+    router = None
+    if os.environ.get('PREDICT_INTERCEPT', '1') == '1':
+        router = Router(layouts)
+    
+    # per-session history, visibility and write directory, made on first frame
+    sessions = Sessions(walls, obj_doors, N_NPC, N_DO, N_DC, make_write_dir,
+                        reply_to_sender=serve, visibility=visibility,
+                        recompute=(mode != 'unity'))
+    
+    # live metrics: JSON on http://127.0.0.1:<port>/ and a periodic summary (0 disables)
+    metrics = Metrics()
+    port = int(os.environ.get('PREDICT_METRICS_PORT', '8002'))
+    every = float(os.environ.get('PREDICT_METRICS_EVERY', '30'))
+    if cache is not None:
+        metrics.watch('cache_hits', lambda: cache.hits)
+        metrics.watch('cache_misses', lambda: cache.misses)
+    if stream:
+        # windowed checks of the streaming models (PREDICT_STREAM_CHECK=1), models may still be loading
+        metrics.watch('stream_checks', lambda: sum(getattr(model, 'checks', 0) for model in models))
+        metrics.watch('stream_max_diff', lambda: max(getattr(model, 'max_diff', 0.0) for model in models))
+    if port > 0:
+        try:
+            serve_metrics(metrics, port)
+        except OSError as err:
+            # the endpoint is optional, a busy port must not stop the predictor
+            print(f'==> METRICS ENDPOINT OFF (port {port}: {err})')
+    if every > 0:
+        log_metrics(metrics, every)
     print("==> WAITING FOR UNITY")
     
-    # main loop
-    while _is_running:
-    
-        # get input data (from Unity)
-        data_in = sock.ReadReceivedData()
-        if data_in is not None:
-            if not _has_started:
-                _has_started = True
-    
-            # parse input data
-            time_info, player_info, npc_info, do_info, dc_info = data_in.split(";")
-    
-            # parse time data
-            time_data   = [float(xi) for xi in time_info.split(',') if len(xi) > 0]
-            time_total  = time_data[0]
-            time_shoot  = time_data[1]
-            time_ahead  = int(time_data[2])
-            step_ahead  = 2*time_ahead
-    
-            # write data to file
-            dump_data(time_shoot, write_dir, data_in)
-    
-            # parse player data
-            player_data = [xi for xi in player_info.split(',') if len(xi) > 0]
-            eye_diam_l  = float(player_data.pop())
-            eye_diam_r  = float(player_data.pop())
-            eye_focus_z = int(player_data.pop())
-            eye_focus_y = int(player_data.pop())
-            eye_focus_x = int(player_data.pop())
-            eye_focus_o = player_data.pop()
-            num_hits    = int(player_data.pop())
-            num_dryfire = int(player_data.pop())
-            num_reload  = int(player_data.pop())
-            num_shot    = int(player_data.pop())
-            
-            shooter_data = [float(xi) for xi in player_data]
-            shooter_x, shooter_y, shooter_z = shooter_data[0:3]
-            shooter_rx, shooter_ry, shooter_rz = shooter_data[3:]
-            px, py, pz = transform(shooter_x, shooter_y, shooter_z)
-            pix, piy, piz = idx(px, py, pz)
-    
-            # parse npc data
-            pos_npc = []
-            vis_npc = []
-            sta_npc = []
-            if npc_info != "":
-                npc_data = [float(xi) for xi in npc_info.split(',') if len(xi) > 0]
-                num_seg = int(len(npc_data) / 5)
-                for ix in range(num_seg):
-                    base = 5 * ix
-                    temp = npc_data[base : base + 5]
-                    pos_npc.extend(temp[0:3])
-                    vis_npc.append(int(temp[3]))
-                    sta_npc.append(int(temp[4]))
-                vis_npc = np.array(vis_npc)
-                sta_npc = np.array(sta_npc)
-            
-            # parse door data
-            do_info = [int(xi) for xi in do_info.split(',') if len(xi) > 0]
-            dc_info = [int(xi) for xi in dc_info.split(',') if len(xi) > 0]
-            vis_do   = np.array(do_info)
-            vis_dc   = np.array(dc_info)
-    
-            # determine cummulative visability
-            if len(vis_npc) > 0:
-                cv_npc = vis_npc| cv_npc
-                cv_do  = vis_do | cv_do
-                cv_dc  = vis_dc | cv_dc
-    
-            # construct occupancy maps
-            acs, pxs, pys = get_steps(px, py, acs, pxs, pys, step_ahead)
-            was = get_walls(pix, piy, piz, full_layout, was, step_ahead)
-            nas = get_occupancy(px, py, piz, pos_npc, cv_npc, nas, step_ahead, 1, sta_npc)
-            nds = get_occupancy(px, py, piz, pos_npc, cv_npc, nds, step_ahead, 0, sta_npc)
-            dos = get_occupancy(px, py, piz, pos_do, cv_do, dos, step_ahead)
-            dcs = get_occupancy(px, py, piz, pos_dc, cv_dc, dcs, step_ahead)
-    
-            # predict trajectory from multi-channel LSTM
-            xy_pred = predict(models, px, py, acs, was, dos, dcs, nas, nds, time_ahead)
-    
-            # convert prediction to unity coordinates
-            unity_x, unity_y, unity_z = python_to_unity(xy_pred, pz)
-    
-            # construct output data (to Unity)
-            data_out = unity_to_string(time_total, unity_x, unity_y, unity_z)
-    
-            # send data string
-            sock.SendData(data_out)
-            last_msg_time = time.time()
-    
-        # timeout logic
-        elif _has_started:
-            if (time.time() - last_msg_time) > TIMEOUT_WARN1 and not _first_warning:
-                _first_warning = True
-                print('==> SIGNAL LOST')
-    
-            if (time.time() - last_msg_time) > TIMEOUT_WARN2 and not _second_warning:
-                _second_warning = True
-                print('==> ABOUT TO SHUT DOWN')
-    
-            if (time.time() - last_msg_time) > TIMEOUT_END:
-                _is_running = False
-                print('==> PROGRAM ENDED')
+    # receive, featurize, infer and send on separate stages until Unity stops
+    try:
+        Runtime(sock, sessions, models, serve, workers, metrics, budget, router).run()
+    finally:
+        sessions.close()
                 
 if __name__ == "__main__":
     run()
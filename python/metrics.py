@@ -0,0 +1,114 @@
+# ----------------------------------------------------------------------------
+# metrics.py
+# Chris McClurg
+#
+# This script collects hot-path timings and counters for main.py: rolling
+# latency percentiles per stage, counters (frames, late replies, model
+# choice), and gauges read on demand (dropped frames). They can be served
+# as JSON over local HTTP and printed as a periodic summary.
+# ----------------------------------------------------------------------------
+
+import json
+import time
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+WINDOW = 2000           # samples kept per stage for the rolling percentiles
+
+class Metrics:
+    '''thread-safe rolling stage timers, counters and gauges'''
+
+    def __init__(self, window=WINDOW):
+        self._lock = threading.Lock()
+        self._times = defaultdict(lambda: deque(maxlen=window))
+        self._counts = defaultdict(int)
+        self._gauges = dict()
+        self.started = time.time()
+
+    def observe(self, stage, seconds):
+        '''add one duration (s) to a stage'''
+        with self._lock:
+            self._times[stage].append(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        '''time the enclosed block as one sample of a stage'''
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - t0)
+
+    def count(self, name, num=1):
+        with self._lock:
+            self._counts[name] += num
+
+    def watch(self, name, fn):
+        '''report fn() under name whenever a snapshot is taken'''
+        self._gauges[name] = fn
+
+    def snapshot(self):
+        '''current state as a JSON-friendly dict (times in ms)'''
+
+        with self._lock:
+            times = {stage: np.array(values) for stage, values in self._times.items()}
+            counts = dict(self._counts)
+        ans = dict()
+        ans['uptime'] = time.time() - self.started
+        ans['counts'] = counts
+        ans['gauges'] = {name: fn() for name, fn in self._gauges.items()}
+        ans['stages'] = dict()
+        for stage, values in times.items():
+            if len(values) == 0:
+                continue
+            p50, p95, p99 = np.percentile(1000*values, [50, 95, 99])
+            ans['stages'][stage] = {'n': len(values), 'p50': float(p50), 'p95': float(p95),
+                                    'p99': float(p99), 'max': float(1000*values.max())}
+        return ans
+
+    def summary(self):
+        '''short multi-line text version of the snapshot'''
+
+        snap = self.snapshot()
+        lines = [f"==> METRICS ({snap['uptime']:.0f} s)"]
+        for stage, stats in snap['stages'].items():
+            lines.append(f"    {stage:<10} p50 {stats['p50']:7.2f}  p95 {stats['p95']:7.2f}  "
+                         f"p99 {stats['p99']:7.2f} ms")
+        values = {**snap['counts'], **snap['gauges']}
+        if values:
+            lines.append('    ' + ', '.join(f'{name} {value}' for name, value in sorted(values.items())))
+        return '\n'.join(lines)
+
+def serve_metrics(metrics, port, host='127.0.0.1'):
+    '''serve metrics.snapshot() as JSON on http://host:port/ from a daemon thread'''
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps(metrics.snapshot()).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def log_metrics(metrics, every):
+    '''print metrics.summary() every few seconds from a daemon thread'''
+
+    def loop():
+        while True:
+            time.sleep(every)
+            print(metrics.summary())
+
+    thread = threading.Thread(target=loop, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,109 @@
+# ----------------------------------------------------------------------------
+# occupancy.py
+# Chris McClurg
+#
+# This script keeps the polar occupancy grids (alive npcs, dead npcs, open
+# doors, closed doors) up to date from one frame to the next. Each object
+# remembers the cell it counts towards. While the shooter stands still, only
+# objects that moved, changed state or became visible are binned again. If
+# the shooter moves, every bin shifts, so the grids are rebuilt in full.
+# ----------------------------------------------------------------------------
+
+import numpy as np
+from functions import prepare_objects, merge_objects, to_radial_bins
+
+NUM_THETA = 20
+NUM_CELLS = 400         # 20 radii × 20 angles
+NUM_CHAN = 4            # 0 alive npcs, 1 dead npcs, 2 open doors, 3 closed doors
+REBUILD_FRACTION = 0.25 # above this share of changed objects a full rebuild is cheaper
+
+def object_slots(px, py, piz, xy, iz, chan, cv_obj):
+    ''' flat grid slot (chan*NUM_CELLS + cell) of each object, -1 if it does not count'''
+
+    ans = np.full(len(xy), -1, dtype=int)
+    keep = (np.asarray(cv_obj) == 1) & (chan >= 0) & (iz == piz)
+    ri, ti = to_radial_bins(xy[keep,0], xy[keep,1], px, py)
+    ans[keep] = np.where(ri >= 0, chan[keep]*NUM_CELLS + ri*NUM_THETA + ti, -1)
+    return ans
+
+def changed(new, old):
+    ''' rows that differ between two arrays (NaN equal to NaN)'''
+
+    diff = (new != old) & ~(np.isnan(new) & np.isnan(old)) if new.dtype.kind == 'f' else new != old
+    return diff.reshape(len(diff), -1).any(axis=1)
+
+class Occupancy:
+    '''occupancy grids of npcs plus static objects, updated from per-object changes'''
+
+    def __init__(self, obj_static, max_changed=REBUILD_FRACTION):
+        self.static = obj_static            # prepared doors (positions never change)
+        self.max_changed = max_changed      # fraction of changed objects that triggers a rebuild
+        self.counts = np.zeros(NUM_CHAN*NUM_CELLS, dtype=int)
+        self.rebuilds = 0
+        self.updates = 0
+        self._shooter = None                # (px, py, piz) the slots were binned for
+        self._pos_npc = None                # raw npc positions last binned
+        self._objs = None                   # prepared npcs then static objects
+        self._cv_obj = None
+        self._slots = None                  # current slot of every object
+
+    def update(self, px, py, piz, pos_npc, chan_npc, cv_obj, outs):
+        ''' bring the grids up to date and write one row per channel into outs'''
+
+        pos_npc = np.asarray(pos_npc, dtype=float).reshape(-1, 3)
+        chan_npc = np.asarray(chan_npc, dtype=int)
+        cv_obj = np.asarray(cv_obj)
+        shooter = (px, py, piz)
+        if self._shooter != shooter or len(cv_obj) != len(self._cv_obj):
+            self._rebuild(shooter, pos_npc, chan_npc, cv_obj)
+        elif not self._update(pos_npc, chan_npc, cv_obj):
+            self._rebuild(shooter, pos_npc, chan_npc, cv_obj)
+
+        grids = self.counts.reshape(NUM_CHAN, NUM_CELLS)
+        for ic, out in enumerate(outs):
+            out[:] = grids[ic] > 0
+        return outs
+
+    def _rebuild(self, shooter, pos_npc, chan_npc, cv_obj):
+        '''bin every object for a new shooter position'''
+
+        self._objs = merge_objects(prepare_objects(pos_npc, chan_npc), self.static)
+        self._slots = object_slots(*shooter, self._objs['xy'], self._objs['iz'], self._objs['chan'], cv_obj)
+        self.counts[:] = np.bincount(self._slots[self._slots >= 0], minlength=len(self.counts))
+        self._shooter = shooter
+        self._pos_npc = pos_npc.copy()
+        self._cv_obj = cv_obj.copy()
+        self.rebuilds += 1
+
+    def _update(self, pos_npc, chan_npc, cv_obj):
+        '''bin again only the objects that moved, changed state or visibility (False: too many)'''
+
+        num_npc = len(pos_npc)
+        objs = self._objs
+        moved = np.flatnonzero(changed(pos_npc, self._pos_npc))
+        dirty = changed(cv_obj, self._cv_obj)
+        dirty[:num_npc] |= chan_npc != objs['chan'][:num_npc]
+        dirty[moved] = True
+        ix = np.flatnonzero(dirty)
+        if len(ix) > self.max_changed*len(dirty):
+            return False
+
+        if len(ix) > 0:
+            # only npcs that moved are transformed again
+            if len(moved) > 0:
+                npcs = prepare_objects(pos_npc[moved], 0)
+                objs['xy'][moved] = npcs['xy']
+                objs['iz'][moved] = npcs['iz']
+                self._pos_npc[moved] = pos_npc[moved]
+            objs['chan'][:num_npc] = chan_npc
+            self._cv_obj[ix] = cv_obj[ix]
+
+            # move each changed object's count from its old slot to its new one
+            old = self._slots[ix]
+            new = object_slots(*self._shooter, objs['xy'][ix], objs['iz'][ix], objs['chan'][ix], cv_obj[ix])
+            np.subtract.at(self.counts, old[old >= 0], 1)
+            np.add.at(self.counts, new[new >= 0], 1)
+            self._slots[ix] = new
+
+        self.updates += 1
+        return True
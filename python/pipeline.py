@@ -0,0 +1,133 @@
+# ----------------------------------------------------------------------------
+# pipeline.py
+# Chris McClurg
+#
+# This script turns parsed Unity frames into model inputs and replies
+# ----------------------------------------------------------------------------
+
+import time
+import itertools
+import numpy as np
+from history import History, INPUTS
+from wire import encode_reply
+from occupancy import Occupancy
+from functions import (
+    transform,
+    idx,
+    get_steps,
+    get_walls,
+    select_model,
+    predict,
+    python_to_unity,
+    unity_to_string,
+)
+
+_stream_ids = itertools.count()   # unique per featurizer, for streaming model state
+
+class Featurizer:
+    '''per-shooter state: history buffers and cumulative visibility'''
+
+    def __init__(self, walls, obj_doors, n_npc, n_do, n_dc, visibility=None, recompute=False):
+        self.walls = walls      # padded wall maps, shared by all sessions
+        self.obj_doors = obj_doors
+        self.visibility = visibility    # line of sight on the wall grid (shared)
+        self.recompute = recompute      # ignore Unity's visibility flags
+        self.occupancy = Occupancy(obj_doors)   # grids updated from per-object changes
+
+        # initialize history buffers (positions, actions, walls, doors, npcs)
+        self.hist = History()
+        self.rows = None        # rows of the newest frame (views, valid until the next step)
+        self.stream_id = next(_stream_ids)
+
+        # initialize cumulative visibility
+        self.cv_npc = np.zeros(n_npc, dtype=int)   # npcs
+        self.cv_do  = np.zeros(n_do, dtype=int)    # open doors
+        self.cv_dc  = np.zeros(n_dc, dtype=int)    # closed doors
+
+    def step(self, frame):
+        '''add one parsed frame to the history and describe the prediction job'''
+
+        hist = self.hist
+        time_ahead = frame['time_ahead']
+        step_ahead = 2*time_ahead
+
+        # player data
+        shooter_x, shooter_y, shooter_z = frame['shooter'][0:3]
+        px, py, pz = transform(shooter_x, shooter_y, shooter_z)
+        pix, piy, piz = idx(px, py, pz)
+
+        # npc data
+        pos_npc = frame['pos_npc']
+        sta_npc = frame['sta_npc']
+        num_seg = len(pos_npc)
+
+        # flags Unity left out (or all, if recomputing) come from the wall grid
+        if self.visibility is not None:
+            self.visibility.fill(frame, px, py, piz, self.recompute)
+
+        # determine cummulative visability
+        if num_seg > 0:
+            self.cv_npc = frame['vis_npc'] | self.cv_npc
+            self.cv_do  = frame['vis_do'] | self.cv_do
+            self.cv_dc  = frame['vis_dc'] | self.cv_dc
+
+        # advance history, then construct occupancy maps in place
+        prev_pos = hist.last('pos')
+        rows = hist.push(step_ahead)
+        self.rows = rows
+        rows['pos'][:] = [px, py]
+        get_steps(px, py, prev_pos, rows['ac'])
+        get_walls(pix, piy, piz, self.walls, rows['wa'])
+
+        # occupancy channels: 0 alive npcs, 1 dead npcs, 2 open doors, 3 closed doors
+        chan_npc = np.where(sta_npc == 1, 0, np.where(sta_npc == 0, 1, -1))
+        obj_cv   = np.concatenate([self.cv_npc[:num_seg], self.cv_do, self.cv_dc])
+        self.occupancy.update(px, py, piz, pos_npc, chan_npc, obj_cv,
+                              [rows['na'], rows['nd'], rows['do'], rows['dc']])
+
+        job = dict()
+        job['time_total'] = frame['time_total']
+        job['time_ahead'] = time_ahead
+        job['px'], job['py'], job['pz'] = px, py, pz
+        job['stream'] = (self.stream_id, hist.steps)
+        job['robots'] = frame.get('robots')     # raw Unity positions (None if not sent)
+        return job
+
+    def inputs(self, copy=False):
+        '''model input windows (views, or copies safe to hand to another thread)'''
+        if copy:
+            return [self.hist.window(name).copy() for name in INPUTS]
+        return [self.hist.window(name) for name in INPUTS]
+
+def respond(models, job, binary=False, budget=None, router=None):
+    '''predict the trajectory for a job and format the reply for Unity'''
+
+    # pick a model (kept on the job); models still loading in the background are
+    # skipped, and with a budget a smaller one is used if the deadline is near
+    acs, was, dos, dcs, nas, nds = job['inputs']
+    ready = getattr(models, 'ready', None)
+    job['mSel_wanted'] = select_model(len(acs), job['time_ahead'], ready)
+    job['mSel'] = job['mSel_wanted']
+    if budget is not None:
+        elapsed = time.perf_counter() - job['t_recv'] if 't_recv' in job else 0.0
+        job['mSel'] = budget.choose(job['mSel'], elapsed, ready)
+
+    # predict trajectory from multi-channel LSTM
+    t0 = time.perf_counter()
+    xy_pred = predict(models, job['px'], job['py'], acs, was, dos, dcs, nas, nds,
+                      job['time_ahead'], job['mSel'], job.get('stream'))
+    if budget is not None:
+        budget.observe(job['mSel'], time.perf_counter() - t0)
+
+    # convert prediction to unity coordinates
+    unity_x, unity_y, unity_z = python_to_unity(xy_pred, job['pz'])
+
+    # intercept points for robots on the shooter's floor (if Unity sent their positions)
+    targets = None
+    if router is not None and job.get('robots') is not None:
+        targets = router.targets(xy_pred, job['pz'], job['robots'])
+
+    # construct output data (to Unity), in the format it was sent
+    if binary:
+        return encode_reply(job['time_total'], unity_x, unity_y, unity_z, job['mSel'], job['mSel_wanted'], targets)
+    return unity_to_string(job['time_total'], unity_x, unity_y, unity_z, job['mSel'], job['mSel_wanted'], targets)
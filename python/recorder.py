@@ -0,0 +1,125 @@
+# ----------------------------------------------------------------------------
+# recorder.py
+# Chris McClurg
+#
+# This script saves the raw Unity frames of a session without blocking the
+# real-time loop. Frames are appended to segment files (seg_00000.log, ...)
+# by a background thread, and index.csv records where each frame lives:
+#
+#   frame,segment,offset,length,format,tShoot
+# ----------------------------------------------------------------------------
+
+import os
+import queue
+import threading
+from wire import is_binary
+
+FRAMES_PER_SEGMENT = 1000   # frames per segment file
+INDEX_FILE = 'index.csv'
+INDEX_HEADER = 'frame,segment,offset,length,format,tShoot\n'
+
+def segment_name(segment):
+    '''file name of a segment'''
+    return f'seg_{segment:05d}.log'
+
+class Recorder:
+    '''non-blocking raw frame log written by a background thread'''
+
+    def __init__(self, path, frames_per_segment=FRAMES_PER_SEGMENT):
+        self.path = path
+        self.frames_per_segment = frames_per_segment
+        self.count = 0              # frames handed over so far (no directory scans)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    def record(self, tShoot, data_in):
+        '''queue raw input from Unity for writing (only once shooting starts)'''
+
+        if (tShoot > 0):
+            print(f"==> DATA DUMPED ({tShoot})")
+            self._queue.put((self.count, tShoot, data_in))
+            self.count += 1
+        else:
+            print("==> DATA NOT RECORDED.")
+
+    def close(self):
+        '''write out everything queued and stop the writer thread'''
+        self._queue.put(None)
+        self._thread.join()
+
+    def _write_loop(self):
+        seg_file = None
+        index_path = os.path.join(self.path, INDEX_FILE)
+        new_index = not os.path.exists(index_path)
+        with open(index_path, 'a') as index_file:
+            if new_index:
+                index_file.write(INDEX_HEADER)
+
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                frame, tShoot, data_in = item
+
+                # start a new segment every N frames
+                segment = frame // self.frames_per_segment
+                if frame % self.frames_per_segment == 0 or seg_file is None:
+                    if seg_file is not None:
+                        seg_file.close()
+                    seg_file = open(os.path.join(self.path, segment_name(segment)), 'ab')
+
+                fmt = 'bin' if is_binary(data_in) else 'txt'
+                if isinstance(data_in, str):
+                    data_in = data_in.encode('utf-8')
+                offset = seg_file.tell()
+                seg_file.write(data_in)
+                index_file.write(f'{frame},{segment},{offset},{len(data_in)},{fmt},{tShoot}\n')
+
+                # flush once caught up, so a crash loses at most the backlog
+                if self._queue.empty():
+                    seg_file.flush()
+                    index_file.flush()
+
+        if seg_file is not None:
+            seg_file.close()
+
+def read_index(path):
+    '''rows of a session index as (frame, segment, offset, length, format, tShoot)'''
+
+    rows = []
+    with open(os.path.join(path, INDEX_FILE)) as index_file:
+        next(index_file)
+        for line in index_file:
+            frame, segment, offset, length, fmt, tShoot = line.strip().split(',')
+            rows.append((int(frame), int(segment), int(offset), int(length), fmt, float(tShoot)))
+    return rows
+
+def iter_frames(path):
+    '''yield the raw frames of a session in order (str for text, bytes for binary)'''
+
+    # segmented log
+    if os.path.exists(os.path.join(path, INDEX_FILE)):
+        seg_file, seg_open = None, None
+        for frame, segment, offset, length, fmt, tShoot in read_index(path):
+            if segment != seg_open:
+                if seg_file is not None:
+                    seg_file.close()
+                seg_file = open(os.path.join(path, segment_name(segment)), 'rb')
+                seg_open = segment
+            seg_file.seek(offset)
+            data_in = seg_file.read(length)
+            yield data_in.decode('utf-8') if fmt == 'txt' else data_in
+        if seg_file is not None:
+            seg_file.close()
+        return
+
+    # older sessions: one numbered file per frame
+    files = [xi for xi in os.listdir(path) if os.path.splitext(xi)[0].isdigit()]
+    for name in sorted(files, key=lambda xi: int(os.path.splitext(xi)[0])):
+        if name.endswith('.bin'):
+            with open(os.path.join(path, name), 'rb') as bin_file:
+                yield bin_file.read()
+        else:
+            with open(os.path.join(path, name)) as text_file:
+                yield text_file.read()
@@ -0,0 +1,164 @@
+# ----------------------------------------------------------------------------
+# replay.py
+# Chris McClurg
+#
+# This script feeds a recorded session back through the prediction pipeline
+# without Unity and reports per-stage latency, frames per second and peak
+# memory. Two modes:
+#
+#   direct  parse -> featurize -> predict -> format in this process
+#   udp     stand in for Unity against a running main.py (lockstep round trips)
+#
+# usage: python replay.py <session dir> [--mode udp] [--backend cv] [--visibility] [--json out.json]
+# ----------------------------------------------------------------------------
+
+import sys
+import json
+import time
+import socket
+import argparse
+import numpy as np
+from wire import is_binary, parse_frame
+from recorder import iter_frames
+from pipeline import Featurizer, respond
+from visibility import Visibility
+from functions import load_layouts, pad_layouts, load_door_objects, cv_pred
+from main import N_NPC, N_DO, N_DC
+
+STAGES = ['parse', 'featurize', 'predict', 'total']
+
+class ConstantVelocityModel:
+    '''model stand-in returning constant-velocity steps (no TensorFlow needed)'''
+
+    def __init__(self, mSel):
+        self.mSel = mSel
+
+    def predict(self, xTest):
+        return np.expand_dims(cv_pred(xTest[0][0], self.mSel), 0)
+
+def load_replay_models(backend):
+    '''prediction models for a replay ('cv' for the constant-velocity stand-in)'''
+    if backend == 'cv':
+        return [ConstantVelocityModel(mSel) for mSel in [5, 10, 20]]
+    from backends import load_models
+    return load_models(backend)
+
+def peak_memory_mb():
+    '''peak resident memory of this process in MB, if the platform reports it'''
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 if sys.platform != 'darwin' else peak / 1024**2
+
+def summarize(times, num_frames, elapsed):
+    '''latency percentiles (ms) per stage plus throughput'''
+
+    ans = dict()
+    ans['frames'] = num_frames
+    ans['seconds'] = elapsed
+    ans['fps'] = num_frames / elapsed if elapsed > 0 else 0.0
+    ans['peak_memory_mb'] = peak_memory_mb()
+    ans['stages'] = dict()
+    for stage, values in times.items():
+        if len(values) == 0:
+            continue
+        values = 1000*np.array(values)
+        ans['stages'][stage] = {
+            'mean': float(np.mean(values)),
+            'p50': float(np.percentile(values, 50)),
+            'p95': float(np.percentile(values, 95)),
+            'p99': float(np.percentile(values, 99)),
+            'max': float(np.max(values)),
+        }
+    return ans
+
+def replay(path, models, walls, obj_doors, repeat=1, visibility=None, recompute=False):
+    '''stream a recorded session through the live pipeline, timing each stage'''
+
+    times = {stage: [] for stage in STAGES}
+    frames = list(iter_frames(path))
+    start = time.perf_counter()
+    for _ in range(repeat):
+        featurizer = Featurizer(walls, obj_doors, N_NPC, N_DO, N_DC, visibility, recompute)
+        for data_in in frames:
+            t0 = time.perf_counter()
+            frame = parse_frame(data_in)
+            t1 = time.perf_counter()
+            job = featurizer.step(frame)
+            job['inputs'] = featurizer.inputs()
+            t2 = time.perf_counter()
+            respond(models, job, is_binary(data_in))
+            t3 = time.perf_counter()
+            times['parse'].append(t1 - t0)
+            times['featurize'].append(t2 - t1)
+            times['predict'].append(t3 - t2)
+            times['total'].append(t3 - t0)
+    elapsed = time.perf_counter() - start
+    return summarize(times, repeat*len(frames), elapsed)
+
+def replay_udp(path, host="127.0.0.1", portTX=8001, portRX=8000, timeout=1.0, repeat=1):
+    '''act as Unity: send each frame to main.py and time the round trip'''
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((host, portRX))
+    sock.settimeout(timeout)
+    times = {'round_trip': []}
+    lost = 0
+    frames = list(iter_frames(path))
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for data_in in frames:
+            if isinstance(data_in, str):
+                data_in = data_in.encode('utf-8')
+            t0 = time.perf_counter()
+            sock.sendto(data_in, (host, portTX))
+            try:
+                sock.recvfrom(65535)
+            except socket.timeout:
+                lost += 1
+                continue
+            times['round_trip'].append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+    sock.close()
+    ans = summarize(times, repeat*len(frames), elapsed)
+    ans['lost'] = lost
+    return ans
+
+def print_report(report):
+    print(f"==> {report['frames']} frames in {report['seconds']:.2f} s ({report['fps']:.1f} fps)")
+    for stage, stats in report['stages'].items():
+        print(f"    {stage:<11} p50 {stats['p50']:7.3f}  p95 {stats['p95']:7.3f}  "
+              f"p99 {stats['p99']:7.3f}  max {stats['max']:7.3f} ms")
+    if report.get('lost'):
+        print(f"    lost replies: {report['lost']}")
+    if report['peak_memory_mb'] is not None:
+        print(f"    peak memory: {report['peak_memory_mb']:.1f} MB")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='replay a recorded session and time the pipeline')
+    parser.add_argument('path', help='session directory written by the recorder (or older dumps)')
+    parser.add_argument('--mode', choices=['direct', 'udp'], default='direct')
+    parser.add_argument('--backend', default='cv', help="keras, direct, onnx or cv (no models)")
+    parser.add_argument('--repeat', type=int, default=1, help='passes over the session')
+    parser.add_argument('--visibility', action='store_true', help="recompute visibility instead of Unity's flags")
+    parser.add_argument('--json', help='also write the report to this file')
+    args = parser.parse_args(argv)
+
+    if args.mode == 'udp':
+        report = replay_udp(args.path, repeat=args.repeat)
+    else:
+        models = load_replay_models(args.backend)
+        layouts, obj_doors = load_layouts(), load_door_objects()
+        report = replay(args.path, models, pad_layouts(layouts), obj_doors, args.repeat,
+                        Visibility(layouts, obj_doors), args.visibility)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(report, json_file, indent=2)
+    return report
+
+if __name__ == "__main__":
+    main()
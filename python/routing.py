@@ -0,0 +1,199 @@
+# ----------------------------------------------------------------------------
+# routing.py
+# Chris McClurg
+#
+# This script answers robot intercept queries on the wall grid, so robots
+# are sent to where they can cut the shooter off instead of each one
+# path-finding to the end of the predicted trajectory. Each floor's wall grid
+# is reduced to blocks of ROUTE_BLOCK × ROUTE_BLOCK cells. Two neighbouring
+# blocks are connected if a free cell of one touches a free cell of the
+# other, so thin walls stay closed. Walking distances come from breadth-first
+# distance fields (in blocks, 4-connected), one per robot block, computed on
+# demand and kept in a small LRU since robots move a block or so per frame.
+#
+# usage: python routing.py   (time a few fields on the current layouts)
+# ----------------------------------------------------------------------------
+
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+from functions import DXY, transform_array, idx_floor, python_to_unity, load_layouts
+
+ROUTE_BLOCK = 2         # grid cells per block side
+UNREACHABLE = np.iinfo(np.uint16).max
+FIELD_CACHE = 64        # distance fields kept (per router)
+ROBOT_SPEED = 38.6 / 3  # local units per second (robotMaxSpeed in ControlRobot.cs)
+STEP_TIME = 0.5         # seconds between predicted trajectory points
+
+def block_graph(layout, block=ROUTE_BLOCK):
+    '''free blocks and the open edges to their right and lower neighbours'''
+
+    free = np.asarray(layout) != 1
+    rows, cols = free.shape
+    nr, nc = -(-rows // block), -(-cols // block)
+    pad = np.zeros((nr*block, nc*block), dtype=bool)
+    pad[:rows, :cols] = free
+    cells = pad.reshape(nr, block, nc, block)
+
+    # a block is usable if any of its cells is free
+    ans = dict()
+    ans['free'] = cells.any(axis=(1, 3))
+
+    # right edge: some row where the last column of a block and the first of the next are free
+    last_col, first_col = cells[:, :, :-1, -1], cells[:, :, 1:, 0]
+    ans['right'] = (last_col & first_col).any(axis=1)        # (nr, nc-1)
+
+    # down edge: some column where the last row of a block and the first of the next are free
+    last_row, first_row = cells[:-1, -1], cells[1:, 0]
+    ans['down'] = (last_row & first_row).any(axis=2)         # (nr-1, nc)
+    return ans
+
+def distance_fields(graph, sources):
+    '''BFS distance (blocks, uint16) from each source block to every block (S, nr*nc)'''
+
+    free, right, down = graph['free'], graph['right'], graph['down']
+    nr, nc = free.shape
+    sources = np.asarray(sources, dtype=int).reshape(-1)
+    seen = np.zeros((len(sources), nr, nc), dtype=bool)
+    seen[np.arange(len(sources)), sources // nc, sources % nc] = free.flat[sources]
+    front = seen.copy()
+    dist = np.full((len(sources), nr, nc), UNREACHABLE, dtype=np.uint16)
+    step = 0
+    while front.any():
+        dist[front] = step
+        grow = np.zeros_like(front)
+        grow[:, :, 1:] |= front[:, :, :-1] & right       # move right
+        grow[:, :, :-1] |= front[:, :, 1:] & right       # move left
+        grow[:, 1:, :] |= front[:, :-1, :] & down        # move down
+        grow[:, :-1, :] |= front[:, 1:, :] & down        # move up
+        front = grow & ~seen
+        seen |= front
+        step += 1
+    return dist.reshape(len(sources), nr*nc)
+
+class Router:
+    '''walking distances and intercept points on each floor (local xy in, local xy out)'''
+
+    def __init__(self, full_layout, block=ROUTE_BLOCK, max_fields=FIELD_CACHE):
+        self.block = block
+        self.max_fields = max_fields
+        self.shape = dict()
+        self.graphs = dict()
+        for name, layout in full_layout.items():
+            floor = int(name.replace('layout', ''))
+            self.graphs[floor] = block_graph(layout, block)
+            self.shape[floor] = self.graphs[floor]['free'].shape
+        self._fields = OrderedDict()    # (floor, block) -> distance field, oldest first
+        self._lock = threading.Lock()   # shared by the inference workers
+
+    def blocks(self, floor, xy):
+        '''block index of local xy (..., 2) -> (...), -1 outside the map'''
+
+        xy = np.asarray(xy, dtype=float)
+        nr, nc = self.shape[floor]
+        with np.errstate(invalid='ignore'):
+            col = np.floor(xy[...,0] / DXY + 0.5) // self.block
+            row = np.floor(xy[...,1] / DXY + 0.5) // self.block
+        inside = (col >= 0) & (col < nc) & (row >= 0) & (row < nr)
+        return np.where(inside, row*nc + col, -1).astype(int)
+
+    def center(self, floor, block_ix):
+        '''local xy of block centres'''
+
+        nc = self.shape[floor][1]
+        row, col = np.divmod(np.asarray(block_ix), nc)
+        half = (self.block - 1) / 2
+        return np.stack([(col*self.block + half)*DXY, (row*self.block + half)*DXY], axis=-1)
+
+    def fields(self, floor, block_ix):
+        '''distance fields of blocks (N,) on a floor (N, nr*nc), searching only the new ones'''
+
+        block_ix = [int(xi) for xi in np.asarray(block_ix).reshape(-1)]
+        with self._lock:
+            missing = sorted(set(xi for xi in block_ix if (floor, xi) not in self._fields))
+        if len(missing) > 0:
+            found = distance_fields(self.graphs[floor], missing)
+        with self._lock:
+            for xi, field in zip(missing, found if len(missing) > 0 else []):
+                self._fields[(floor, xi)] = field
+            ans = []
+            for xi in block_ix:
+                field = self._fields.get((floor, xi))
+                if field is None:       # evicted by another worker meanwhile
+                    field = distance_fields(self.graphs[floor], [xi])[0]
+                    self._fields[(floor, xi)] = field
+                self._fields.move_to_end((floor, xi))
+                ans.append(field)
+            while len(self._fields) > self.max_fields:
+                self._fields.popitem(last=False)
+        return np.array(ans).reshape(len(block_ix), -1)
+
+    def distance(self, floor, xy_from, xy_to):
+        '''walking distance (local units) from xy rows (M, 2) to xy rows (N, 2) -> (M, N), inf where unreachable'''
+
+        src = self.blocks(floor, np.asarray(xy_from, dtype=float).reshape(-1, 2))
+        dst = self.blocks(floor, np.asarray(xy_to, dtype=float).reshape(-1, 2))
+        ans = np.full((len(src), len(dst)), np.inf)
+        ok_src, ok_dst = src >= 0, dst >= 0
+        if ok_src.any() and ok_dst.any():
+            steps = self.fields(floor, src[ok_src])[:, dst[ok_dst]].astype(float)
+            steps[steps == UNREACHABLE] = np.inf
+            ans[np.ix_(ok_src, ok_dst)] = steps*self.block*DXY
+        return ans
+
+    def intercept(self, floor, trajectory, robots, dt=STEP_TIME, speed=None):
+        '''best point of a predicted trajectory (T, 2) for each robot (R, 2)
+
+        With a speed (local units per second) a robot takes the earliest point it can
+        reach before the shooter does (point t is reached at (t+1)*dt); otherwise, or if
+        none is reachable in time, the point with the shortest walk. Returns a dict of
+        per-robot arrays: step (-1 if nothing reachable), x, y and distance.'''
+
+        trajectory = np.asarray(trajectory, dtype=float).reshape(-1, 2)
+        robots = np.asarray(robots, dtype=float).reshape(-1, 2)
+        traj_ix = self.blocks(floor, trajectory)
+        num_robots, num_steps = len(robots), len(trajectory)
+        ans = {'step': np.full(num_robots, -1), 'x': np.full(num_robots, np.nan),
+               'y': np.full(num_robots, np.nan), 'distance': np.full(num_robots, np.inf)}
+        if num_steps == 0 or num_robots == 0:
+            return ans
+
+        # walking distance from each robot to each trajectory point (R, T)
+        dist = self.distance(floor, robots, trajectory)
+        best = np.argmin(dist, axis=1)
+        if speed is not None:
+            in_time = dist / speed <= dt*np.arange(1, num_steps + 1)
+            best = np.where(in_time.any(axis=1), np.argmax(in_time, axis=1), best)
+
+        best_dist = dist[np.arange(num_robots), best]
+        found = np.isfinite(best_dist)
+        point = self.center(floor, traj_ix[best])
+        ans['step'][found] = best[found]
+        ans['x'][found] = point[found, 0]
+        ans['y'][found] = point[found, 1]
+        ans['distance'][found] = best_dist[found]
+        return ans
+
+    def targets(self, xy_pred, pz, robots_raw, speed=ROBOT_SPEED):
+        '''Unity intercept points for robots at raw Unity positions (R, 3), given a
+        predicted trajectory (T, 2) at height pz; (robot index, x, y, z) for each robot
+        on the shooter's floor that can reach the trajectory'''
+
+        floor = int(idx_floor(np.array([0.0]), np.array([pz]))[0])
+        robots = transform_array(robots_raw)
+        on_floor = np.flatnonzero(idx_floor(robots[:,0], robots[:,2]) == floor)
+        if floor not in self.graphs or len(on_floor) == 0:
+            return []
+        found = self.intercept(floor, xy_pred, robots[on_floor, 0:2], speed=speed)
+        unity_x, unity_y, unity_z = python_to_unity(np.stack([found['x'], found['y']], axis=-1), pz)
+        return [(int(ix), float(unity_x[i]), float(unity_y[i]), float(unity_z[i]))
+                for i, ix in enumerate(on_floor) if found['step'][i] >= 0]
+
+if __name__ == "__main__":
+    router = Router(load_layouts())
+    for floor, (nr, nc) in router.shape.items():
+        free = np.flatnonzero(router.graphs[floor]['free'])
+        t0 = time.perf_counter()
+        distance_fields(router.graphs[floor], free[:8])
+        print(f'==> FLOOR {floor}: {nr}×{nc} blocks, {1000*(time.perf_counter() - t0)/8:.2f} ms per field')
@@ -0,0 +1,221 @@
+# ----------------------------------------------------------------------------
+# runtime.py
+# Chris McClurg
+#
+# This script runs the receive -> featurize -> infer -> send stages of
+# main.py on separate threads. Every frame is featurized (history needs
+# them all), but inference and sending only ever take the newest job of
+# each session, so a slow prediction skips stale frames instead of
+# queueing behind them.
+# ----------------------------------------------------------------------------
+
+import time
+import threading
+from collections import OrderedDict
+from wire import is_binary, is_hello, answer_hello, parse_frame
+from pipeline import respond
+from metrics import Metrics
+
+TIMEOUT_WARN1 = 5.0     # wait time before first warning
+TIMEOUT_WARN2 = 8.0     # wait time before second warning
+TIMEOUT_END   = 10.0    # wait time before ending script
+POLL          = 0.5     # how long a stage blocks before checking for shutdown
+LATE_AFTER    = 0.1     # receive-to-send time after which a reply counts as late
+
+class LatestSlot:
+    '''mailbox holding the newest unread item per key (one key by default)'''
+
+    def __init__(self, exclusive=False):
+        self._cond = threading.Condition()
+        self._items = OrderedDict()
+        self._busy = set()           # keys taken but not yet done (exclusive only)
+        self.exclusive = exclusive
+        self.dropped = 0
+
+    def put(self, item, key=None):
+        '''store an item, replacing any unread one with the same key'''
+        with self._cond:
+            if key in self._items:
+                self.dropped += 1
+            self._items[key] = item
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        '''wait for an item and take it, longest waiting key first, else None'''
+        with self._cond:
+            # keys may be None (single station), so readiness is checked apart from the key
+            if not self._cond.wait_for(self._has_ready, timeout):
+                return None
+            key = self._ready()
+            if self.exclusive:
+                self._busy.add(key)
+            return self._items.pop(key)
+
+    def done(self, key=None):
+        '''release a key taken by get, so its next item can be handed out'''
+        with self._cond:
+            self._busy.discard(key)
+            self._cond.notify_all()
+
+    def _has_ready(self):
+        return any(key not in self._busy for key in self._items)
+
+    def _ready(self):
+        '''longest waiting key that is not taken (only call if _has_ready)'''
+        return next(key for key in self._items if key not in self._busy)
+
+class Runtime:
+    '''staged real-time loop between Unity clients and the prediction models'''
+
+    def __init__(self, sock, sessions, models, serve=False, workers=1, metrics=None, budget=None, router=None):
+        self.sock = sock
+        self.sessions = sessions
+        self.models = models
+        self.serve = serve          # keep running when sessions end
+        self.workers = workers      # inference threads (batched models need several)
+        self.budget = budget        # deadline-aware model choice (None: always the wanted model)
+        self.router = router        # robot intercept points (None: trajectory only)
+
+        self.jobs = LatestSlot(exclusive=True)  # featurize -> infer, newest job per session
+        self.replies = LatestSlot()  # infer -> send, newest reply per session
+        self._stop = threading.Event()
+
+        # stage timers and counters; dropped frames are read when reported
+        self.metrics = Metrics() if metrics is None else metrics
+        self.metrics.watch('dropped_rx', lambda: getattr(self.sock, 'dropped', 0))
+        self.metrics.watch('dropped_jobs', lambda: self.jobs.dropped)
+        self.metrics.watch('dropped_replies', lambda: self.replies.dropped)
+        self.metrics.watch('sessions', lambda: len(self.sessions))
+        if budget is not None:
+            self.metrics.watch('model_ms', budget.snapshot)
+
+    def run(self):
+        '''start the stages and block until Unity goes quiet'''
+
+        stages = [self._infer_loop for _ in range(self.workers)] + [self._send_loop]
+        threads = [threading.Thread(target=fn, daemon=True) for fn in stages]
+        for thread in threads:
+            thread.start()
+
+        # featurize on the calling thread, it also owns the timeout logic
+        try:
+            self._featurize_loop()
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+
+    def _featurize_loop(self):
+        while not self._stop.is_set():
+
+            # get input data (from Unity), blocking instead of spinning
+            data_in, addr = self.sock.ReadReceivedFrom(timeout=POLL)
+            if data_in is not None:
+                t_recv = time.perf_counter()
+
+                # answer protocol handshake (binary frames follow if agreed)
+                if is_hello(data_in):
+                    self.sock.SendData(answer_hello(data_in), addr if self.serve else None)
+                    continue
+
+                # a malformed datagram (from any host) is dropped, not fatal
+                try:
+                    self._handle_frame(data_in, addr, t_recv)
+                except Exception as err:
+                    self.metrics.count('bad_frames')
+                    print(f'==> BAD FRAME FROM {addr} ({type(err).__name__}: {err})')
+
+            # timeout logic (the script ends with its last session unless serving)
+            if self._check_timeouts() and not self.serve and len(self.sessions) == 0:
+                return
+
+    def _handle_frame(self, data_in, addr, t_recv):
+        '''parse, featurize and record one frame, then queue its job'''
+
+        # parse input data (binary or text)
+        with self.metrics.timer('parse'):
+            binary = is_binary(data_in)
+            if not binary:
+                data_in = data_in.decode('utf-8')
+            frame = parse_frame(data_in)
+        self.metrics.count('frames')
+
+        # session named in the frame, else one per sender
+        key = frame['session'] if frame['session'] is not None else addr
+        session = self.sessions.get(key, addr)
+        session.last_msg_time = time.time()
+
+        # update history (filling in visibility if needed)
+        with self.metrics.timer('featurize'):
+            job = session.featurizer.step(frame)
+            job['inputs'] = session.featurizer.inputs(copy=True)
+
+        # write data to file (in the background)
+        with self.metrics.timer('record'):
+            session.record(frame, data_in)
+
+        # hand the newest job to inference
+        job['t_recv'] = t_recv
+        job['binary'] = binary
+        job['addr'] = session.addr
+        job['key'] = key
+        self.jobs.put(job, key)
+
+    def _check_timeouts(self):
+        '''warn about and end quiet sessions; True if any session ended'''
+
+        ended = False
+        now = time.time()
+        for session in self.sessions:
+            label = f' ({session.key})' if self.serve else ''
+            quiet = now - session.last_msg_time
+            if quiet > TIMEOUT_WARN1 and not session.first_warning:
+                session.first_warning = True
+                print(f'==> SIGNAL LOST{label}')
+
+            if quiet > TIMEOUT_WARN2 and not session.second_warning:
+                session.second_warning = True
+                print(f'==> ABOUT TO SHUT DOWN{label}')
+
+            if quiet > TIMEOUT_END:
+                self.sessions.end(session)
+                ended = True
+                print(f'==> SESSION ENDED{label}' if self.serve else '==> PROGRAM ENDED')
+
+        return ended
+
+    def _infer_loop(self):
+        while not self._stop.is_set():
+            job = self.jobs.get(timeout=POLL)
+            if job is None:
+                continue
+
+            # one worker per session at a time, so replies stay in order
+            try:
+                self.metrics.observe('wait', time.perf_counter() - job['t_recv'])
+                with self.metrics.timer('predict'):
+                    data_out = respond(self.models, job, job['binary'], self.budget, self.router)
+                self.metrics.count(f"mSel_{job['mSel']}")
+                if job['mSel'] != job['mSel_wanted']:
+                    self.metrics.count('downgraded')
+                self.replies.put((data_out, job['addr'], job['t_recv']), job['addr'])
+            except Exception as err:
+                # a failed prediction skips this frame, the worker keeps going
+                self.metrics.count('infer_errors')
+                print(f'==> PREDICTION FAILED ({type(err).__name__}: {err})')
+            finally:
+                self.jobs.done(job['key'])
+
+    def _send_loop(self):
+        while not self._stop.is_set():
+            reply = self.replies.get(timeout=POLL)
+            if reply is not None:
+                data_out, addr, t_recv = reply
+                with self.metrics.timer('send'):
+                    self.sock.SendData(data_out, addr)
+
+                # receive-to-send latency of this frame
+                latency = time.perf_counter() - t_recv
+                self.metrics.observe('total', latency)
+                if latency > LATE_AFTER:
+                    self.metrics.count('late')
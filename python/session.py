@@ -0,0 +1,82 @@
+# ----------------------------------------------------------------------------
+# session.py
+# Chris McClurg
+#
+# This script keeps the state of each Unity client (VR station) served by
+# one Python process. Models, layouts and static doors are loaded once and
+# shared; history, visibility and recording live in a Session per station.
+# ----------------------------------------------------------------------------
+
+import os
+import time
+from pipeline import Featurizer
+from recorder import Recorder
+from store import ColumnWriter, STORE_DIR
+
+class Session:
+    '''state of one shooter: featurizer, recorder, column store and liveness'''
+
+    def __init__(self, key, featurizer, recorder, addr=None, store=None):
+        self.key = key
+        self.featurizer = featurizer
+        self.recorder = recorder
+        self.store = store                  # parsed frames as columns (optional)
+        self.addr = addr                    # where replies go (None: default port)
+        self.last_msg_time = time.time()    # time of last message
+        self.first_warning = False
+        self.second_warning = False
+
+    def record(self, frame, data_in):
+        '''log the raw frame and, once shooting starts, its parsed columns'''
+        self.recorder.record(frame['time_shoot'], data_in)
+        if self.store is not None and frame['time_shoot'] > 0:
+            self.store.append(frame)
+
+    def close(self):
+        self.recorder.close()
+        if self.store is not None:
+            self.store.close()
+
+class Sessions:
+    '''sessions keyed by id, created on their first frame'''
+
+    def __init__(self, walls, obj_doors, n_npc, n_do, n_dc, make_dir, reply_to_sender=False,
+                 visibility=None, recompute=False):
+        self.walls = walls
+        self.obj_doors = obj_doors
+        self.visibility = visibility
+        self.recompute = recompute
+        self.counts = (n_npc, n_do, n_dc)
+        self.make_dir = make_dir
+        self.reply_to_sender = reply_to_sender
+        self._sessions = dict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __iter__(self):
+        return iter(list(self._sessions.values()))
+
+    def get(self, key, addr):
+        '''session for a key (new one if unseen), noting the sender address'''
+
+        session = self._sessions.get(key)
+        if session is None:
+            featurizer = Featurizer(self.walls, self.obj_doors, *self.counts, self.visibility, self.recompute)
+            path = self.make_dir(key, addr)     # tagged with this session and station
+            store = ColumnWriter(os.path.join(path, STORE_DIR), *self.counts)
+            session = Session(key, featurizer, Recorder(path), store=store)
+            self._sessions[key] = session
+            print(f'==> SESSION STARTED ({key})')
+        if self.reply_to_sender:
+            session.addr = addr
+        return session
+
+    def end(self, session):
+        '''close a session and forget it'''
+        self._sessions.pop(session.key, None)
+        session.close()
+
+    def close(self):
+        for session in self:
+            self.end(session)
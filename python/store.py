@@ -0,0 +1,220 @@
+# ----------------------------------------------------------------------------
+# store.py
+# Chris McClurg
+#
+# This script keeps parsed frames of a session as columns: one flat binary
+# file per field (time, player pose, eye data, NPC position/visibility/state,
+# door visibility) with a fixed dtype and row shape, described by
+# schema.json. Rows are appended in chunks by a background thread, and the
+# reader memory-maps the columns so a time range can be sliced without
+# loading the whole session. Visibility flags that Unity left out (binary
+# version 3) are stored as zeros when an old log is converted.
+#
+# usage: python store.py <session dir> [<session dir> ...]   (convert old logs)
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import queue
+import shutil
+import threading
+import numpy as np
+
+CHUNK_FRAMES = 256      # rows buffered before a chunk is written
+SCHEMA_FILE = 'schema.json'
+STORE_DIR = 'columns'   # sub-directory of a session directory
+
+def make_schema(n_npc, n_do, n_dc):
+    '''column name -> (dtype, row shape) for a session with these object counts'''
+
+    ans = dict()
+    ans['time'] = ('<f8', (3,))                 # time total, shoot, ahead
+    ans['shooter'] = ('<f4', (6,))              # player pose as sent by Unity
+    ans['counts'] = ('<i4', (4,))               # shots, reloads, dry fires, hits
+    ans['eye'] = ('<f4', (5,))                  # focus xyz, pupil diameter r, l
+    ans['eye_focus_o'] = ('S32', ())            # name of the focused object
+    ans['pos_npc'] = ('<f4', (n_npc, 3))
+    ans['vis_npc'] = ('u1', (n_npc,))
+    ans['sta_npc'] = ('i1', (n_npc,))
+    ans['vis_do'] = ('u1', (n_do,))
+    ans['vis_dc'] = ('u1', (n_dc,))
+    return ans
+
+def fit(values, length, fill):
+    '''pad or cut a per-object array to the schema length'''
+
+    values = np.asarray(values)
+    if len(values) == length:
+        return values
+    ans = np.full((length,) + values.shape[1:], fill, dtype=values.dtype if len(values) else float)
+    num = min(length, len(values))
+    ans[:num] = values[:num]
+    return ans
+
+def flags(values):
+    '''visibility flags, or none (binary version 3 leaves them out)'''
+    return [] if values is None else values
+
+def frame_row(frame, schema):
+    '''one row per column from a parsed frame (see wire.parse_frame)'''
+
+    # flags left out by Unity are stored as zeros (not seen)
+    n_npc = schema['pos_npc'][1][0]
+    ans = dict()
+    ans['time'] = [frame['time_total'], frame['time_shoot'], frame['time_ahead']]
+    ans['shooter'] = fit(frame['shooter'], 6, np.nan)
+    ans['counts'] = [frame['num_shot'], frame['num_reload'], frame['num_dryfire'], frame['num_hits']]
+    ans['eye'] = list(frame['eye_focus']) + [frame['eye_diam_r'], frame['eye_diam_l']]
+    ans['eye_focus_o'] = frame['eye_focus_o'].encode('utf-8')[:32]
+    ans['pos_npc'] = fit(frame['pos_npc'], n_npc, np.nan)
+    ans['vis_npc'] = fit(flags(frame['vis_npc']), n_npc, 0)
+    ans['sta_npc'] = fit(frame['sta_npc'], n_npc, -1)
+    ans['vis_do'] = fit(flags(frame['vis_do']), schema['vis_do'][1][0], 0)
+    ans['vis_dc'] = fit(flags(frame['vis_dc']), schema['vis_dc'][1][0], 0)
+    return ans
+
+class ColumnWriter:
+    '''append parsed frames to a columnar store; chunks are written by a background thread'''
+
+    def __init__(self, path, n_npc, n_do, n_dc, chunk_frames=CHUNK_FRAMES):
+        self.path = path
+        self.chunk_frames = chunk_frames
+        self.count = 0
+        os.makedirs(path, exist_ok=True)
+
+        # reuse the schema of an existing store, so appends line up
+        schema_path = os.path.join(path, SCHEMA_FILE)
+        if os.path.exists(schema_path):
+            self.schema = read_schema(path)
+        else:
+            self.schema = make_schema(n_npc, n_do, n_dc)
+            with open(schema_path, 'w') as schema_file:
+                json.dump({name: [dtype, list(shape)] for name, (dtype, shape) in self.schema.items()},
+                          schema_file, indent=2)
+
+        self._chunk = self._new_chunk()
+        self._rows = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    def _new_chunk(self):
+        return {name: np.zeros((self.chunk_frames,) + shape, dtype=dtype)
+                for name, (dtype, shape) in self.schema.items()}
+
+    def append(self, frame):
+        '''copy one parsed frame into the current chunk'''
+
+        for name, values in frame_row(frame, self.schema).items():
+            self._chunk[name][self._rows] = values
+        self._rows += 1
+        self.count += 1
+        if self._rows == self.chunk_frames:
+            self.flush()
+
+    def flush(self):
+        '''hand the rows buffered so far to the writer thread'''
+        if self._rows > 0:
+            self._queue.put((self._chunk, self._rows))
+            self._chunk = self._new_chunk()
+            self._rows = 0
+
+    def close(self):
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            chunk, rows = item
+            for name, values in chunk.items():
+                with open(os.path.join(self.path, f'{name}.bin'), 'ab') as column_file:
+                    column_file.write(values[:rows].tobytes())
+
+def read_schema(path):
+    with open(os.path.join(path, SCHEMA_FILE)) as schema_file:
+        schema = json.load(schema_file)
+    return {name: (dtype, tuple(shape)) for name, (dtype, shape) in schema.items()}
+
+class ColumnReader:
+    '''memory-mapped columns of a stored session, sliceable by time'''
+
+    def __init__(self, path):
+        self.path = path
+        self.schema = read_schema(path)
+        self._columns = dict()
+
+        # row count from the shortest column (a crash may leave one chunk partly written)
+        self.length = min(self._rows_on_disk(name) for name in self.schema)
+
+    def _rows_on_disk(self, name):
+        dtype, shape = self.schema[name]
+        file = os.path.join(self.path, f'{name}.bin')
+        size = os.path.getsize(file) if os.path.exists(file) else 0
+        return size // (np.dtype(dtype).itemsize * int(np.prod(shape)))
+
+    def __len__(self):
+        return self.length
+
+    def column(self, name):
+        '''whole column as a read-only memmap, shape (rows,) + row shape'''
+
+        if name not in self._columns:
+            dtype, shape = self.schema[name]
+            if self.length == 0:
+                self._columns[name] = np.zeros((0,) + shape, dtype=dtype)
+            else:
+                self._columns[name] = np.memmap(os.path.join(self.path, f'{name}.bin'), dtype=dtype,
+                                                mode='r', shape=(self.length,) + shape)
+        return self._columns[name]
+
+    def rows(self, t0=None, t1=None):
+        '''row range [start, stop) with t0 <= time_total < t1 (times are increasing)'''
+
+        time_total = self.column('time')[:, 0]
+        start = 0 if t0 is None else int(np.searchsorted(time_total, t0, side='left'))
+        stop = self.length if t1 is None else int(np.searchsorted(time_total, t1, side='left'))
+        return start, stop
+
+    def between(self, t0=None, t1=None, names=None):
+        '''columns sliced to t0 <= time_total < t1 (views; only those pages are read)'''
+
+        start, stop = self.rows(t0, t1)
+        names = self.schema if names is None else names
+        return {name: self.column(name)[start:stop] for name in names}
+
+def convert_session(path, n_npc=None, n_do=None, n_dc=None):
+    '''build the columnar store of a recorded session from its raw frame log'''
+
+    from wire import FRAME_HEADER, is_binary, parse_frame
+    from recorder import iter_frames
+
+    # start over, so converting twice does not append the session twice
+    store = os.path.join(path, STORE_DIR)
+    if os.path.exists(store):
+        shutil.rmtree(store)
+
+    writer = None
+    for data_in in iter_frames(path):
+        frame = parse_frame(data_in)
+        if writer is None:
+            # object counts from the binary header, as version 3 sends no door flags
+            if is_binary(data_in):
+                counts = list(FRAME_HEADER.unpack_from(data_in, 0)[3:6])
+            else:
+                counts = [len(frame['pos_npc']), len(frame['vis_do']), len(frame['vis_dc'])]
+            counts = [num if given is None else given for num, given in zip(counts, [n_npc, n_do, n_dc])]
+            writer = ColumnWriter(store, *counts)
+        writer.append(frame)
+    if writer is None:
+        return 0
+    writer.close()
+    return writer.count
+
+if __name__ == "__main__":
+    for session in sys.argv[1:]:
+        print(f'==> {session}: {convert_session(session)} frames')
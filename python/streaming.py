@@ -0,0 +1,176 @@
+# ----------------------------------------------------------------------------
+# streaming.py
+# Chris McClurg
+#
+# This script runs an LSTM predictor frame by frame instead of re-feeding the
+# whole 2*mSel window on every prediction. The windowed model always starts
+# from a zero state at the oldest row of the window, so a single carried state
+# would drift from it. Instead each stream keeps one lane per window offset:
+# every new row starts a fresh lane and advances all the others. The lane
+# that has seen exactly the last 2*mSel rows gives the same encoding as the
+# windowed pass. The input projection (by far the largest matrix product,
+# 2043 features per row) is done once per row rather than once per row per
+# window. Only the recurrent step and the head after the LSTM run per frame.
+# ----------------------------------------------------------------------------
+
+import threading
+from collections import OrderedDict
+import numpy as np
+from backends import model_input
+
+STREAM_SESSIONS = 64    # streams kept per model (least recently used dropped)
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+class LSTMCell:
+    '''numpy LSTM step with the Keras weight layout (gates i, f, c, o)'''
+
+    def __init__(self, kernel, recurrent_kernel, bias):
+        self.kernel = np.asarray(kernel, dtype=np.float32)
+        self.recurrent_kernel = np.asarray(recurrent_kernel, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.units = self.recurrent_kernel.shape[0]
+
+    def project(self, x):
+        '''input part of the gates for rows of x (..., features) -> (..., 4*units)'''
+        return x @ self.kernel + self.bias
+
+    def step(self, xw, h, c):
+        '''advance states (lanes, units) by one row with projected input xw'''
+
+        z = xw + h @ self.recurrent_kernel
+        i, f, g, o = np.split(z, 4, axis=-1)
+        c = sigmoid(f)*c + sigmoid(i)*np.tanh(g)
+        h = sigmoid(o)*np.tanh(c)
+        return h, c
+
+    def run(self, x):
+        '''final state of a full pass over rows x (batch, steps, features) from zero'''
+
+        xw = self.project(x)
+        h = np.zeros((len(x), self.units), dtype=np.float32)
+        c = np.zeros_like(h)
+        for t in range(x.shape[1]):
+            h, c = self.step(xw[:,t], h, c)
+        return h
+
+class Stream:
+    '''staggered lanes of one session: lane k started k rows after lane k-1'''
+
+    def __init__(self, num_lanes, units):
+        self.h = np.zeros((num_lanes, units), dtype=np.float32)
+        self.c = np.zeros((num_lanes, units), dtype=np.float32)
+        self.next = 0           # lane restarted by the next row
+        self.rows = 0           # rows seen since the stream was (re)built
+        self.steps = None       # history step the stream is up to
+
+    def advance(self, cell, xw):
+        '''restart the oldest lane, then step every lane with one projected row'''
+
+        self.h[self.next] = 0
+        self.c[self.next] = 0
+        self.h, self.c = cell.step(xw, self.h, self.c)
+        self.next = (self.next + 1) % len(self.h)
+        self.rows += 1
+
+    def encoding(self):
+        '''state of the lane that has seen exactly the last num_lanes rows'''
+        return self.h[self.next]
+
+class StreamingModel:
+    '''LSTM predictor split into per-row front, numpy LSTM cell and head'''
+
+    def __init__(self, cell, head, front=None, check=None, max_streams=STREAM_SESSIONS):
+        self.cell = cell
+        self.head = head                # encoding (batch, units) -> model output
+        self.front = front              # per-row inputs -> LSTM input (None: concatenate)
+        self.check = check              # windowed model to compare against (None: off)
+        self.max_streams = max_streams
+        self.checks = 0
+        self.max_diff = 0.0
+        self._streams = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _rows(self, xTest, start):
+        '''LSTM inputs of window rows start.. (steps, features)'''
+
+        if self.front is None:
+            return np.concatenate([np.asarray(elem[0, start:], dtype=np.float32) for elem in xTest], axis=-1)
+        return np.asarray(self.front(model_input(xTest)))[0, start:]   # model inputs have a fixed length
+
+    def predict(self, xTest):
+        '''windowed pass (no stream), same output as the original model'''
+
+        rows = self._rows(xTest, 0)
+        return self.head(self.cell.run(rows[None]))
+
+    def predict_stream(self, stream_id, steps, xTest):
+        '''advance the stream to history step `steps` and decode the latest window'''
+
+        num_lanes = xTest[0].shape[1]
+        with self._lock:
+            stream = self._streams.pop(stream_id, None)
+
+        # catch up on rows since the last prediction (jobs can be skipped),
+        # or rebuild from the window if the stream is new or too far behind
+        missed = None if stream is None or stream.steps is None else steps - stream.steps
+        if missed is None or missed < 0 or missed > num_lanes:
+            stream = Stream(num_lanes, self.cell.units)
+            missed = num_lanes
+        if missed > 0:
+            xw = self.cell.project(self._rows(xTest, num_lanes - missed))
+            for row in xw:
+                stream.advance(self.cell, row)
+        stream.steps = steps
+
+        with self._lock:
+            self._streams[stream_id] = stream
+            while len(self._streams) > self.max_streams:
+                self._streams.popitem(last=False)
+
+        ans = self.head(stream.encoding()[None])
+        if self.check is not None:
+            diff = float(np.max(np.abs(np.asarray(ans) - np.asarray(self.check.predict(xTest)))))
+            self.checks += 1
+            self.max_diff = max(self.max_diff, diff)
+        return ans
+
+def from_keras(model, check=False):
+    '''split a Keras model at its first LSTM (inputs -> per-row layers -> LSTM -> head)'''
+
+    import tensorflow as tf
+    from backends import KerasBackend
+
+    lstms = [layer for layer in model.layers if isinstance(layer, tf.keras.layers.LSTM)]
+    if len(lstms) == 0:
+        raise ValueError('model has no LSTM layer to stream')
+    lstm = lstms[0]
+    if lstm.return_sequences or lstm.go_backwards or lstm.stateful:
+        raise ValueError('only a forward LSTM returning its last state can be streamed')
+    if lstm.activation is not tf.keras.activations.tanh or lstm.recurrent_activation is not tf.keras.activations.sigmoid:
+        raise ValueError('only tanh/sigmoid LSTM activations can be streamed')
+    weights = lstm.get_weights()
+    if len(weights) == 2:
+        weights.append(np.zeros(weights[1].shape[1], dtype=np.float32))
+    cell = LSTMCell(*weights)
+
+    # layers before the LSTM act per row; skip them if they only concatenate the inputs
+    front = tf.keras.Model(model.inputs, lstm.input)
+    sample = [np.random.rand(1, elem.shape[1], elem.shape[-1]).astype(np.float32) for elem in model.inputs]
+    joined = np.concatenate(sample, axis=-1)
+    rows = front(sample, training=False).numpy()
+    if rows.shape == joined.shape and np.allclose(rows, joined):
+        front_call = None
+    else:
+        front_call = lambda x: front(x, training=False).numpy()
+
+    # layers after the LSTM (assumed to form a chain) become the head
+    head_in = tf.keras.Input(shape=tuple(lstm.output.shape[1:]))
+    x = head_in
+    for layer in model.layers[model.layers.index(lstm)+1:]:
+        x = layer(x)
+    head = tf.keras.Model(head_in, x)
+    head_call = lambda h: head(h, training=False).numpy()
+
+    return StreamingModel(cell, head_call, front_call, KerasBackend(model) if check else None)
@@ -0,0 +1,228 @@
+# ----------------------------------------------------------------------------
+# synthetic.py
+# Chris McClurg
+#
+# This script fabricates Unity frames for load testing: a two-floor school
+# of rooms and corridors of any size, a shooter and NPCs on random walks
+# that turn at walls, NPCs dying as time goes on, doors placed in the room
+# walls and a robot on each floor. Frames come out as the dict parse_frame returns and can be
+# encoded in either wire format, so they go through the same code as
+# real sessions.
+#
+# usage: python synthetic.py <out dir> [--frames 600] [--npc 116] [--rows 71 --cols 131]
+#        (writes a recorded session, e.g. for replay.py --mode udp)
+# ----------------------------------------------------------------------------
+
+import os
+import struct
+import argparse
+import numpy as np
+from wire import FRAME_HEADER, FRAME_SESSION, FRAME_TIME, FRAME_PLAYER, MAGIC, KIND_FRAME
+from functions import DXY, inverse_transform_array, prepare_objects, merge_objects, pad_layouts
+
+ROOM = 12               # cells between room walls
+GAP = 3                 # width of the openings in room walls (cells)
+FLOOR_Z = [0.0, 14.0]   # local z of floors 1 and 2
+FRAME_DT = 0.5          # seconds between frames
+SPEED_SHOOTER = 4.0     # local units per frame
+SPEED_NPC = 2.0
+SPEED_ROBOT = 6.0
+TURN = 0.6              # heading noise per frame (radians, std)
+DEATH_RATE = 0.002      # chance per frame that an alive npc dies
+SEEN_RATE = 0.2         # chance an object is flagged visible in a frame
+
+def make_layout(rows, cols, rng, room=ROOM, gap=GAP):
+    '''wall map (rows, cols) of rooms separated by walls with openings'''
+
+    ans = np.zeros((rows, cols), dtype=np.uint8)
+    for row in range(room, rows - 1, room):
+        ans[row, :] = 1
+        for start in range(0, cols - 1, room):
+            hole = start + 1 + rng.integers(0, max(1, room - gap))
+            ans[row, hole:hole+gap] = 0
+    for col in range(room, cols - 1, room):
+        ans[:, col] = 1
+        for start in range(0, rows - 1, room):
+            hole = start + 1 + rng.integers(0, max(1, room - gap))
+            ans[hole:hole+gap, col] = 0
+
+    # outer walls have no openings
+    ans[[0, -1], :] = 1
+    ans[:, [0, -1]] = 1
+    return ans
+
+def to_raw(xy, z):
+    '''local xy rows (N, 2) on local height z to raw Unity xyz rows (N, 3)'''
+
+    pos = np.column_stack([xy, np.broadcast_to(z, len(xy))])
+    return inverse_transform_array(pos)
+
+class Walker:
+    '''objects moving at a fixed speed, turning at random and away from walls'''
+
+    def __init__(self, layout, num, speed, rng):
+        self.layout = layout
+        self.speed = speed
+        self.rng = rng
+        free = np.argwhere(layout == 0)
+        cells = free[rng.integers(0, len(free), num)]
+        self.xy = cells[:, ::-1] * float(DXY)
+        self.heading = rng.uniform(0, 2*np.pi, num)
+
+    def step(self):
+        self.heading += self.rng.normal(0, TURN, len(self.xy))
+        move = self.speed * np.column_stack([np.cos(self.heading), np.sin(self.heading)])
+        new = self.xy + move
+        col = np.floor(new[:, 0] / DXY + 0.5).astype(int)
+        row = np.floor(new[:, 1] / DXY + 0.5).astype(int)
+        rows, cols = self.layout.shape
+        inside = (col >= 0) & (col < cols) & (row >= 0) & (row < rows)
+        ok = inside.copy()
+        ok[inside] = self.layout[row[inside], col[inside]] == 0
+
+        # blocked walkers stay put and turn around
+        self.xy[ok] = new[ok]
+        self.heading[~ok] += np.pi + self.rng.normal(0, 0.5, (~ok).sum())
+        return self.xy
+
+class Scenario:
+    '''synthetic school: layouts, static doors and a stream of frames'''
+
+    def __init__(self, n_npc=116, n_do=17, n_dc=90, rows=71, cols=131, time_ahead=5, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.counts = (n_npc, n_do, n_dc)
+        self.time_ahead = time_ahead
+        self.layouts = {f'layout{floor}': make_layout(rows, cols, self.rng) for floor in [1, 2]}
+
+        # doors sit in room walls, split over both floors
+        self.pos_do = self._doors(n_do)
+        self.pos_dc = self._doors(n_dc)
+
+        # shooter on the first floor, npcs on either
+        self.shooter = Walker(self.layouts['layout1'], 1, SPEED_SHOOTER, self.rng)
+        self.npc_floor = self.rng.integers(0, 2, n_npc)
+        self.npcs = [Walker(self.layouts[f'layout{floor+1}'], n_npc, SPEED_NPC, self.rng) for floor in [0, 1]]
+        self.alive = np.ones(n_npc, dtype=int)
+        self.robots = [Walker(self.layouts[f'layout{floor+1}'], 1, SPEED_ROBOT, self.rng) for floor in [0, 1]]
+        self.num = 1
+
+    def _doors(self, num):
+        '''raw Unity positions of num doors on wall cells of either floor'''
+
+        ans = []
+        for floor in self.rng.integers(0, 2, num):
+            layout = self.layouts[f'layout{floor+1}']
+            walls = np.argwhere(layout == 1)
+            row, col = walls[self.rng.integers(0, len(walls))]
+            ans.append(to_raw(np.array([[col, row]]) * float(DXY), FLOOR_Z[floor])[0])
+        return np.array(ans).reshape(-1, 3)
+
+    def walls(self):
+        return pad_layouts(self.layouts)
+
+    def obj_doors(self):
+        '''prepared static doors, like functions.load_door_objects'''
+        return merge_objects(prepare_objects(self.pos_do.ravel(), 2), prepare_objects(self.pos_dc.ravel(), 3))
+
+    def frame(self):
+        '''advance everything by one frame and return it as parse_frame would'''
+
+        n_npc, n_do, n_dc = self.counts
+        shooter_xy = self.shooter.step()
+        npc_xy = np.where(self.npc_floor[:, None] == 0, self.npcs[0].step(), self.npcs[1].step())
+        npc_z = np.array(FLOOR_Z)[self.npc_floor]
+        self.alive[self.rng.random(n_npc) < DEATH_RATE] = 0
+
+        ans = dict()
+        ans['session'] = None
+        ans['time_total'] = self.num * FRAME_DT
+        ans['time_shoot'] = self.num * FRAME_DT
+        ans['time_ahead'] = self.time_ahead
+        ans['shooter'] = np.round(np.concatenate([to_raw(shooter_xy, FLOOR_Z[0])[0], [0, self.rng.uniform(0, 360), 0]]), 1)
+        ans['num_shot'], ans['num_reload'], ans['num_dryfire'], ans['num_hits'] = self.num // 4, self.num // 40, 0, self.num // 20
+        ans['eye_focus'] = ans['shooter'][0:3].copy()
+        ans['eye_focus_o'] = 'na'
+        ans['eye_diam_r'], ans['eye_diam_l'] = 3.5, 3.5
+        ans['pos_npc'] = np.round(to_raw(npc_xy, npc_z), 1)
+        ans['vis_npc'] = (self.rng.random(n_npc) < SEEN_RATE).astype(int)
+        ans['sta_npc'] = self.alive.copy()
+        ans['vis_do'] = (self.rng.random(n_do) < SEEN_RATE).astype(int)
+        ans['vis_dc'] = (self.rng.random(n_dc) < SEEN_RATE).astype(int)
+        robot_xy = np.concatenate([robot.step() for robot in self.robots])
+        ans['robots'] = np.round(to_raw(robot_xy, np.array(FLOOR_Z)), 1)
+        self.num += 1
+        return ans
+
+    def frames(self, num):
+        return [self.frame() for _ in range(num)]
+
+def encode_text(frame):
+    '''frame dict -> text frame in the layout parse_text reads (not byte-for-byte what Unity sends)'''
+
+    # npcs go out as x,y,z,visible,alive groups, which is what parse_text (and the
+    # original main) expect; ShooterPredictor.cs instead sends all positions, then
+    # all visible flags, then all states, so text timings are not a Unity capture
+
+    def join(values, fmt):
+        return ''.join(format(xi, fmt) + ',' for xi in values)
+
+    time_info = f"{frame['time_total']},{frame['time_shoot']},{frame['time_ahead']}"
+    counts = [frame['num_shot'], frame['num_reload'], frame['num_dryfire'], frame['num_hits']]
+    player_info = (join(frame['shooter'], '.1f') + join(counts, 'd') + frame['eye_focus_o'] + ','
+                   + join(frame['eye_focus'], '.1f') + f"{frame['eye_diam_r']},{frame['eye_diam_l']}")
+    npc_rows = np.column_stack([frame['pos_npc'], frame['vis_npc'], frame['sta_npc']])
+    npc_info = ''.join(f'{x:.1f},{y:.1f},{z:.1f},{int(vis)},{int(sta)},' for x, y, z, vis, sta in npc_rows)
+    ans = ';'.join([time_info, player_info, npc_info, join(frame['vis_do'], 'd'), join(frame['vis_dc'], 'd')])
+    if frame.get('robots') is not None:
+        robots = frame['robots']
+        ans += ';' + join([0]*len(robots), 'd') + join(np.ravel(robots), '.1f')
+    if frame['session'] is not None:
+        ans = f"@{frame['session']};" + ans
+    return ans
+
+def encode_binary(frame, version=2):
+    '''frame dict -> binary frame of the given version (see wire.py; 3 leaves out visibility)'''
+
+    n_npc, n_do, n_dc = len(frame['pos_npc']), len(frame['vis_do']), len(frame['vis_dc'])
+    ans = [FRAME_HEADER.pack(MAGIC, version, KIND_FRAME, n_npc, n_do, n_dc)]
+    if version >= 2:
+        ans.append(FRAME_SESSION.pack(frame['session'] or 0))
+    ans.append(FRAME_TIME.pack(frame['time_total'], frame['time_shoot'], frame['time_ahead']))
+    counts = [frame['num_shot'], frame['num_reload'], frame['num_dryfire'], frame['num_hits']]
+    ans.append(FRAME_PLAYER.pack(*frame['shooter'][0:6], *counts, *frame['eye_focus'],
+                                 frame['eye_diam_r'], frame['eye_diam_l']))
+    name = frame['eye_focus_o'].encode('utf-8')[:255]
+    ans.append(struct.pack('<B', len(name)) + name)
+    ans.append(np.asarray(frame['pos_npc'], dtype='<f4').tobytes())
+    if version < 3:
+        ans.append(np.asarray(frame['vis_npc'], dtype=np.uint8).tobytes())
+    ans.append(np.asarray(frame['sta_npc'], dtype=np.uint8).tobytes())
+    if version < 3:
+        ans.append(np.asarray(frame['vis_do'], dtype=np.uint8).tobytes())
+        ans.append(np.asarray(frame['vis_dc'], dtype=np.uint8).tobytes())
+    if frame.get('robots') is not None:
+        ans.append(struct.pack('<B', len(frame['robots'])) + np.asarray(frame['robots'], dtype='<f4').tobytes())
+    return b''.join(ans)
+
+def main(argv=None):
+    from recorder import Recorder
+
+    parser = argparse.ArgumentParser(description='write a synthetic recorded session')
+    parser.add_argument('out', help='session directory to write')
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--npc', type=int, default=116)
+    parser.add_argument('--rows', type=int, default=71)
+    parser.add_argument('--cols', type=int, default=131)
+    parser.add_argument('--binary', action='store_true', help='binary frames instead of text')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    scenario = Scenario(args.npc, rows=args.rows, cols=args.cols, seed=args.seed)
+    os.makedirs(args.out, exist_ok=True)
+    recorder = Recorder(args.out)
+    for frame in scenario.frames(args.frames):
+        recorder.record(frame['time_shoot'], encode_binary(frame) if args.binary else encode_text(frame))
+    recorder.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# ----------------------------------------------------------------------------
+# test_occupancy.py
+# Chris McClurg
+#
+# This script checks that the batched and incremental occupancy grids are
+# identical to the original per-object get_occupancy loop (alive and dead
+# NPCs, open and closed doors) over a run of synthetic frames.
+#
+# usage: python -m unittest test_occupancy   (or pytest, from this directory)
+# ----------------------------------------------------------------------------
+
+import unittest
+import numpy as np
+from history import CHANNELS
+from pipeline import Featurizer
+from synthetic import Scenario
+from functions import transform, idx, get_occupancy, get_occupancies, prepare_objects, merge_objects
+
+NUM_FRAMES = 120
+
+def legacy_grids(px, py, piz, frame, pos_do, pos_dc, cv_npc, cv_do, cv_dc):
+    '''the four calls the original main made per frame (alive, dead, open, closed)'''
+
+    pos_npc = frame['pos_npc'].ravel()
+    return [get_occupancy(px, py, piz, pos_npc, cv_npc, [], 1, 1, frame['sta_npc'])[-1],
+            get_occupancy(px, py, piz, pos_npc, cv_npc, [], 1, 0, frame['sta_npc'])[-1],
+            get_occupancy(px, py, piz, pos_do, cv_do, [], 1)[-1],
+            get_occupancy(px, py, piz, pos_dc, cv_dc, [], 1)[-1]]
+
+class OccupancyTest(unittest.TestCase):
+
+    def test_matches_legacy_loop(self):
+        scenario = Scenario(seed=4)
+        n_npc, n_do, n_dc = scenario.counts
+        obj_doors = scenario.obj_doors()
+        featurizer = Featurizer(scenario.walls(), obj_doors, n_npc, n_do, n_dc)
+        pos_do, pos_dc = scenario.pos_do.ravel(), scenario.pos_dc.ravel()
+        cv_npc, cv_do, cv_dc = np.zeros(n_npc, dtype=int), np.zeros(n_do, dtype=int), np.zeros(n_dc, dtype=int)
+        outs = [np.zeros(CHANNELS['na'][0], dtype=np.uint8) for _ in range(4)]
+
+        occupied = 0
+        for frame in scenario.frames(NUM_FRAMES):
+            featurizer.step(frame)
+            cv_npc, cv_do, cv_dc = cv_npc | frame['vis_npc'], cv_do | frame['vis_do'], cv_dc | frame['vis_dc']
+            px, py, pz = transform(*frame['shooter'][0:3])
+            _, _, piz = idx(px, py, pz)
+            legacy = legacy_grids(px, py, piz, frame, pos_do, pos_dc, cv_npc, cv_do, cv_dc)
+
+            # batched, all channels in one pass
+            sta = frame['sta_npc']
+            chan = np.where(sta == 1, 0, np.where(sta == 0, 1, -1))
+            objs = merge_objects(prepare_objects(frame['pos_npc'].ravel(), chan), obj_doors)
+            get_occupancies(px, py, piz, objs, np.concatenate([cv_npc, cv_do, cv_dc]), outs)
+
+            # incremental, as kept by the featurizer
+            for name, grid, out in zip(['na', 'nd', 'do', 'dc'], legacy, outs):
+                np.testing.assert_array_equal(out.reshape(grid.shape), grid)
+                np.testing.assert_array_equal(featurizer.rows[name].reshape(grid.shape), grid)
+                occupied += int(grid.sum())
+
+        # the run must actually fill some cells
+        self.assertGreater(occupied, 0)
+
+if __name__ == "__main__":
+    unittest.main()
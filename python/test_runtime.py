@@ -0,0 +1,121 @@
+# ----------------------------------------------------------------------------
+# test_runtime.py
+# Chris McClurg
+#
+# This script runs the staged loop end to end over loopback UDP, with
+# synthetic frames and constant-velocity models, and checks that replies
+# make it back to the sender.
+#
+# usage: python -m unittest test_runtime   (or pytest, from this directory)
+# ----------------------------------------------------------------------------
+
+import socket
+import tempfile
+import threading
+import unittest
+import runtime
+from wire import Comms
+from session import Sessions
+from synthetic import Scenario, encode_text
+from replay import ConstantVelocityModel
+
+NUM_FRAMES = 20
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+class RuntimeLoopbackTest(unittest.TestCase):
+
+    def setUp(self):
+        # end sessions quickly once the frames stop
+        self._timeouts = (runtime.TIMEOUT_WARN1, runtime.TIMEOUT_WARN2, runtime.TIMEOUT_END, runtime.POLL)
+        runtime.TIMEOUT_WARN1, runtime.TIMEOUT_WARN2, runtime.TIMEOUT_END, runtime.POLL = 2.0, 2.5, 3.0, 0.05
+
+    def tearDown(self):
+        runtime.TIMEOUT_WARN1, runtime.TIMEOUT_WARN2, runtime.TIMEOUT_END, runtime.POLL = self._timeouts
+
+    def run_loop(self, serve, frames, junk=()):
+        '''send frames (after any junk datagrams) to a Runtime over loopback, return the replies'''
+
+        port_unity, port_python = free_port(), free_port()
+        client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        client.bind(('127.0.0.1', port_unity))
+        client.settimeout(0.5)
+        comms = Comms(udpIP='127.0.0.1', portTX=port_unity, portRX=port_python)
+
+        scenario = Scenario(seed=1)
+        out_dir = tempfile.mkdtemp()
+        sessions = Sessions(scenario.walls(), scenario.obj_doors(), *scenario.counts,
+                            lambda key, addr: tempfile.mkdtemp(dir=out_dir), reply_to_sender=serve)
+        models = [ConstantVelocityModel(mSel) for mSel in [5, 10, 20]]
+        loop = runtime.Runtime(comms, sessions, models, serve)
+        thread = threading.Thread(target=loop.run, daemon=True)
+        thread.start()
+
+        # lockstep, like Unity waiting on each prediction
+        replies = []
+        try:
+            for data in junk:
+                client.sendto(data, ('127.0.0.1', port_python))
+            for frame in frames:
+                client.sendto(encode_text(frame).encode('utf-8'), ('127.0.0.1', port_python))
+                try:
+                    replies.append(client.recvfrom(65535)[0])
+                except socket.timeout:
+                    pass
+        finally:
+            loop._stop.set()
+            thread.join(5)
+            sessions.close()
+            comms.close()
+            client.close()
+        return replies, loop
+
+    def test_single_station_replies(self):
+        frames = Scenario(seed=1).frames(NUM_FRAMES)
+        replies, loop = self.run_loop(False, frames)
+        self.assertEqual(len(replies), NUM_FRAMES)
+        self.assertEqual(loop.metrics.snapshot()['counts']['frames'], NUM_FRAMES)
+
+    def test_serve_replies(self):
+        frames = Scenario(seed=1).frames(NUM_FRAMES)
+        replies, loop = self.run_loop(True, frames)
+        self.assertEqual(len(replies), NUM_FRAMES)
+
+    def test_prediction_error_keeps_worker(self):
+        frames = Scenario(seed=1).frames(NUM_FRAMES)
+        calls = {'num': 0}
+        predict = ConstantVelocityModel.predict
+
+        # the first LSTM prediction fails, later ones must still be answered
+        def flaky(model, xTest):
+            calls['num'] += 1
+            if calls['num'] == 1:
+                raise RuntimeError('bad inference')
+            return predict(model, xTest)
+
+        ConstantVelocityModel.predict = flaky
+        try:
+            replies, loop = self.run_loop(False, frames)
+        finally:
+            ConstantVelocityModel.predict = predict
+        self.assertEqual(loop.metrics.snapshot()['counts']['infer_errors'], 1)
+        self.assertEqual(len(replies), NUM_FRAMES - 1)
+
+    def test_bad_frames_dropped(self):
+        frames = Scenario(seed=1).frames(NUM_FRAMES)
+        junk = [b'not a frame', b'SP\x02\x01', b'1,2;3;4;5;6', bytes([0xff, 0xfe])]
+        replies, loop = self.run_loop(True, frames, junk)
+        self.assertEqual(loop.metrics.snapshot()['counts']['bad_frames'], len(junk))
+        self.assertEqual(len(replies), NUM_FRAMES)
+
+    def test_latest_slot_none_key(self):
+        slot = runtime.LatestSlot()
+        slot.put('reply')
+        self.assertEqual(slot.get(timeout=0.1), 'reply')
+        self.assertIsNone(slot.get(timeout=0.01))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+# ----------------------------------------------------------------------------
+# test_store.py
+# Chris McClurg
+#
+# This script records synthetic sessions into the segmented raw log, converts
+# them to the columnar store and reads them back: the index, the raw frames,
+# every column and time-range slices, for text and binary frames (version 3
+# included, where the visibility flags are left out).
+#
+# usage: python -m unittest test_store   (or pytest, from this directory)
+# ----------------------------------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from synthetic import Scenario, encode_text, encode_binary
+from recorder import Recorder, read_index, iter_frames, segment_name
+from store import ColumnReader, convert_session, STORE_DIR
+
+NUM_FRAMES = 40
+FRAMES_PER_SEGMENT = 16     # small, so a session spans several segments
+
+class StoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.scenario = Scenario(n_npc=20, n_do=4, n_dc=9, seed=6)
+        self.frames = self.scenario.frames(NUM_FRAMES)
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def record(self, encode):
+        recorder = Recorder(self.path, FRAMES_PER_SEGMENT)
+        raw = [encode(frame) for frame in self.frames]
+        for frame, data_in in zip(self.frames, raw):
+            recorder.record(frame['time_shoot'], data_in)
+        recorder.close()
+        return raw
+
+    def check_log(self, raw, fmt):
+        index = read_index(self.path)
+        self.assertEqual([row[0] for row in index], list(range(NUM_FRAMES)))
+        self.assertEqual([row[1] for row in index], [num // FRAMES_PER_SEGMENT for num in range(NUM_FRAMES)])
+        self.assertTrue(all(row[4] == fmt for row in index))
+        self.assertEqual([row[5] for row in index], [frame['time_shoot'] for frame in self.frames])
+        self.assertTrue(os.path.exists(os.path.join(self.path, segment_name(2))))
+        self.assertEqual(list(iter_frames(self.path)), raw)
+
+    def check_store(self, flags):
+        self.assertEqual(convert_session(self.path), NUM_FRAMES)
+        reader = ColumnReader(os.path.join(self.path, STORE_DIR))
+        n_npc, n_do, n_dc = self.scenario.counts
+        self.assertEqual(len(reader), NUM_FRAMES)
+        self.assertEqual(reader.schema['vis_do'][1], (n_do,))
+        self.assertEqual(reader.schema['vis_dc'][1], (n_dc,))
+
+        np.testing.assert_allclose(reader.column('time')[:, 0], [frame['time_total'] for frame in self.frames])
+        np.testing.assert_allclose(reader.column('pos_npc'), [frame['pos_npc'] for frame in self.frames], atol=1e-3)
+        np.testing.assert_array_equal(reader.column('sta_npc'), [frame['sta_npc'] for frame in self.frames])
+        for name in ['vis_npc', 'vis_do', 'vis_dc']:
+            expected = [frame[name] for frame in self.frames] if flags else np.zeros(reader.column(name).shape)
+            np.testing.assert_array_equal(reader.column(name), expected, err_msg=name)
+
+        # time slices: t0 <= time_total < t1
+        t0, t1 = self.frames[5]['time_total'], self.frames[23]['time_total']
+        part = reader.between(t0, t1, ['time', 'pos_npc'])
+        self.assertEqual(len(part['time']), 18)
+        np.testing.assert_allclose(part['pos_npc'], [frame['pos_npc'] for frame in self.frames[5:23]], atol=1e-3)
+        self.assertEqual(len(reader.between(t1=t0)['time']), 5)
+        self.assertEqual(len(reader.between(t0=t1)['time']), NUM_FRAMES - 23)
+
+        # converting again starts over rather than appending
+        self.assertEqual(convert_session(self.path), NUM_FRAMES)
+        self.assertEqual(len(ColumnReader(os.path.join(self.path, STORE_DIR))), NUM_FRAMES)
+
+    def test_text(self):
+        self.check_log(self.record(encode_text), 'txt')
+        self.check_store(flags=True)
+
+    def test_binary(self):
+        self.check_log(self.record(lambda frame: encode_binary(frame, 2)), 'bin')
+        self.check_store(flags=True)
+
+    def test_binary_without_visibility(self):
+        self.check_log(self.record(lambda frame: encode_binary(frame, 3)), 'bin')
+        self.check_store(flags=False)
+
+if __name__ == "__main__":
+    unittest.main()
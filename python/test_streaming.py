@@ -0,0 +1,80 @@
+# ----------------------------------------------------------------------------
+# test_streaming.py
+# Chris McClurg
+#
+# This script checks that the streaming LSTM lanes give the same output as
+# the windowed forward pass, with small random weights standing in for the
+# Keras models: frame by frame, with frames skipped, after a gap longer than
+# the window, and with several sessions interleaved.
+#
+# usage: python -m unittest test_streaming   (or pytest, from this directory)
+# ----------------------------------------------------------------------------
+
+import unittest
+import numpy as np
+from streaming import LSTMCell, StreamingModel
+
+NUM_LANES = 8           # rows per window (2*mSel)
+FEATURES = [2, 5, 3]    # per-row widths of the model inputs
+UNITS = 6
+TOLERANCE = 1e-5
+
+def keras_lstm(x, kernel, recurrent_kernel, bias):
+    '''reference Keras LSTM pass (gates i, f, c, o) over rows x (steps, features) from zero'''
+
+    units = recurrent_kernel.shape[0]
+    h, c = np.zeros(units), np.zeros(units)
+    for row in x:
+        z = row @ kernel + h @ recurrent_kernel + bias
+        i, f, g, o = [z[k*units:(k+1)*units] for k in range(4)]
+        i, f, o = [1 / (1 + np.exp(-elem)) for elem in (i, f, o)]
+        c = f*c + i*np.tanh(g)
+        h = o*np.tanh(c)
+    return h
+
+class StreamingTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        num_in = sum(FEATURES)
+        self.weights = [rng.normal(0, 0.5, (num_in, 4*UNITS)).astype(np.float32),
+                        rng.normal(0, 0.5, (UNITS, 4*UNITS)).astype(np.float32),
+                        rng.normal(0, 0.1, 4*UNITS).astype(np.float32)]
+        self.dense = rng.normal(0, 0.5, (UNITS, 4)).astype(np.float32)
+        self.model = StreamingModel(LSTMCell(*self.weights), lambda h: h @ self.dense)
+        self.rows = [rng.normal(0, 1, (200, width)).astype(np.float32) for width in FEATURES]
+
+    def window(self, step):
+        '''model inputs (1, NUM_LANES, width) ending at history step `step`'''
+        return [elem[None, step-NUM_LANES+1:step+1] for elem in self.rows]
+
+    def expected(self, step):
+        x = np.concatenate([elem[0] for elem in self.window(step)], axis=-1).astype(float)
+        return keras_lstm(x, *[np.asarray(w, dtype=float) for w in self.weights]) @ self.dense
+
+    def check(self, stream_id, steps):
+        for step in steps:
+            xTest = self.window(step)
+            streamed = self.model.predict_stream(stream_id, step, xTest)[0]
+            np.testing.assert_allclose(streamed, self.expected(step), atol=TOLERANCE, err_msg=f'step {step}')
+            np.testing.assert_allclose(self.model.predict(xTest)[0], self.expected(step), atol=TOLERANCE)
+
+    def test_every_frame(self):
+        self.check(0, range(NUM_LANES - 1, 60))
+
+    def test_skipped_frames(self):
+        # jobs dropped by the runtime: catch up on 1..NUM_LANES missed rows
+        steps = [10, 11, 13, 16, 20, 20 + NUM_LANES, 20 + NUM_LANES + 1]
+        self.check(1, steps)
+
+    def test_rebuilt_streams(self):
+        # too far behind, or history restarted: the stream is rebuilt from the window
+        self.check(2, [10, 11, 11 + NUM_LANES + 5, 12 + NUM_LANES + 5, 9, 10])
+
+    def test_interleaved_sessions(self):
+        for step in range(NUM_LANES - 1, 40):
+            self.check(3, [step])
+            self.check(4, [step + 100])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+# ----------------------------------------------------------------------------
+# test_wire.py
+# Chris McClurg
+#
+# This script checks the UDP contract with ShooterPredictor.cs: synthetic
+# frames encoded as text and as binary versions 1 to 3 parse back to the same
+# values, the HELLO handshake agrees on the right version, and replies carry
+# the coordinates, the model used/wanted and the robot intercept points.
+#
+# usage: python -m unittest test_wire   (or pytest, from this directory)
+# ----------------------------------------------------------------------------
+
+import struct
+import unittest
+import numpy as np
+from synthetic import Scenario, encode_text, encode_binary
+from functions import unity_to_string
+from wire import (
+    VERSION,
+    REPLY_HEADER,
+    REPLY_MODEL,
+    REPLY_TARGET,
+    parse_frame,
+    is_binary,
+    is_hello,
+    answer_hello,
+    encode_reply,
+)
+
+SCALARS = ['time_total', 'time_shoot', 'time_ahead', 'num_shot', 'num_reload', 'num_dryfire', 'num_hits',
+           'eye_focus_o', 'eye_diam_r', 'eye_diam_l']
+ARRAYS = ['shooter', 'eye_focus', 'pos_npc', 'sta_npc', 'robots']
+FLAGS = ['vis_npc', 'vis_do', 'vis_dc']
+
+def frames(session=None):
+    ans = Scenario(n_npc=12, n_do=3, n_dc=7, seed=5).frames(5)
+    for frame in ans:
+        frame['session'] = session
+    return ans
+
+class WireTest(unittest.TestCase):
+
+    def assertRoundTrip(self, frame, parsed, flags=True):
+        for name in SCALARS:
+            self.assertEqual(parsed[name], frame[name], name)
+        for name in ARRAYS:
+            np.testing.assert_allclose(parsed[name], frame[name], atol=1e-4, err_msg=name)
+        for name in FLAGS:
+            if flags:
+                np.testing.assert_array_equal(parsed[name], frame[name], err_msg=name)
+            else:
+                self.assertIsNone(parsed[name], name)
+
+    def test_text(self):
+        for session in [None, 7]:
+            for frame in frames(session):
+                with self.subTest(session=session):
+                    data_in = encode_text(frame)
+                    self.assertFalse(is_binary(data_in.encode('utf-8')))
+                    parsed = parse_frame(data_in)
+                    self.assertEqual(parsed['session'], session)
+                    self.assertRoundTrip(frame, parsed)
+
+    def test_binary(self):
+        for version in range(1, VERSION + 1):
+            for frame in frames(7):
+                with self.subTest(version=version):
+                    data_in = encode_binary(frame, version)
+                    self.assertTrue(is_binary(data_in))
+                    parsed = parse_frame(data_in)
+                    self.assertEqual(parsed['session'], 7 if version >= 2 else None)
+                    self.assertRoundTrip(frame, parsed, flags=(version < 3))
+
+    def test_without_robots(self):
+        # frames from before the robot section parse with robots None
+        frame = frames()[0]
+        frame['robots'] = None
+        for data_in in [encode_text(frame)] + [encode_binary(frame, version) for version in range(1, VERSION + 1)]:
+            self.assertIsNone(parse_frame(data_in)['robots'])
+
+    def test_hello(self):
+        for asked, agreed in [('1', 1), ('2', 2), ('3', 3), (str(VERSION + 5), VERSION), ('-1', 0), ('x', 0), ('', 0)]:
+            with self.subTest(asked=asked):
+                data_in = f'HELLO;{asked}'.encode('utf-8')
+                self.assertTrue(is_hello(data_in))
+                self.assertEqual(answer_hello(data_in), f'HELLO;{agreed}')
+        self.assertEqual(answer_hello('HELLO'), 'HELLO;0')
+        self.assertFalse(is_hello(encode_text(frames()[0])))
+
+    def test_reply(self):
+        x, y, z = [518.9, 520.1], [0.0, 0.0], [900.5, 903.2]
+        targets = [(1, 334.5, 42.0, 931.8)]
+
+        # binary: header, xyz blocks, model used/wanted, then the targets
+        data_out = encode_reply(2.5, x, y, z, 10, 20, targets)
+        magic, version, kind, t, num = REPLY_HEADER.unpack_from(data_out, 0)
+        self.assertEqual((magic, version, kind, t, num), (b'SP', 1, 2, 2.5, 2))
+        body = np.frombuffer(data_out, dtype='<f4', count=3*num, offset=REPLY_HEADER.size).reshape(3, num)
+        np.testing.assert_allclose(body, [x, y, z], atol=1e-4)
+        offset = REPLY_HEADER.size + 12*num
+        self.assertEqual(REPLY_MODEL.unpack_from(data_out, offset), (10, 20))
+        offset += REPLY_MODEL.size
+        self.assertEqual(struct.unpack_from('<B', data_out, offset)[0], 1)
+        ix, tx, ty, tz = REPLY_TARGET.unpack_from(data_out, offset + 1)
+        self.assertEqual(ix, 1)
+        np.testing.assert_allclose([tx, ty, tz], targets[0][1:], atol=1e-4)
+        self.assertEqual(len(data_out), offset + 1 + REPLY_TARGET.size)
+
+        # text: time; x; y; z; used,wanted; index,x,y,z
+        sects = unity_to_string(2.5, x, y, z, 10, 20, targets).split(';')
+        self.assertEqual(sects[0], '2.5')
+        np.testing.assert_allclose([[float(xi) for xi in sect.split(',')] for sect in sects[1:4]], [x, y, z])
+        self.assertEqual(sects[4], '10,20')
+        self.assertEqual(sects[5], '1,334.5,42.0,931.8')
+
+if __name__ == "__main__":
+    unittest.main()
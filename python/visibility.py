@@ -0,0 +1,138 @@
+# ----------------------------------------------------------------------------
+# visibility.py
+# Chris McClurg
+#
+# This script decides line of sight from the shooter to every NPC and door
+# on the wall grid, so visibility no longer has to come from Unity. Each
+# sight line is sampled every SAMPLE_STEP cells and is blocked if a sample
+# lands on a wall cell. The cells of the shooter and of the target do not
+# count, much like the probe offset of CheckVisible in Unity. Objects on the
+# other floor are never visible. All lines of a frame are checked in one
+# batched pass. Doors never move, so their flags can also be precomputed
+# for every cell of both floors and memory-mapped from a cache.
+#
+# usage: python visibility.py   (build the door caches for the current layouts)
+# ----------------------------------------------------------------------------
+
+import os
+import hashlib
+import numpy as np
+from functions import DXY, LAYOUT_CACHE, transform_array, idx, idx_floor, load_layouts, load_door_objects
+
+SAMPLE_STEP = 0.5       # cells between samples along a sight line
+CHUNK_CELLS = 64        # viewer cells per batch when building the door cache
+
+def line_of_sight(layout, start, end, step=SAMPLE_STEP):
+    '''True where the line between local xy start (..., 2) and end (..., 2) crosses no wall'''
+
+    start, end = np.broadcast_arrays(np.asarray(start, dtype=float), np.asarray(end, dtype=float))
+    shape = start.shape[:-1]
+    a = start.reshape(-1, 2) / DXY
+    b = end.reshape(-1, 2) / DXY
+    finite = np.isfinite(a).all(axis=1) & np.isfinite(b).all(axis=1)
+    ans = np.zeros(len(a), dtype=bool)
+    if not finite.any():
+        return ans.reshape(shape)
+    a, b = a[finite], b[finite]
+
+    # evenly spaced samples per line, padded to the longest line
+    num = np.ceil(np.hypot(*(b - a).T) / step).astype(int) + 1
+    frac = np.arange(num.max()) / np.maximum(num - 1, 1)[:, None]
+    frac[frac > 1] = 1      # padding repeats the target cell, which never blocks
+    col = np.floor(a[:, 0:1] + frac*(b - a)[:, 0:1] + 0.5).astype(int)
+    row = np.floor(a[:, 1:2] + frac*(b - a)[:, 1:2] + 0.5).astype(int)
+
+    # samples off the map never block (they are mapped to a free border cell),
+    # nor do the viewer's and the target's own cells
+    rows, cols = np.shape(layout)
+    walls = np.zeros((rows + 2, cols + 2), dtype=bool)
+    walls[1:-1, 1:-1] = np.asarray(layout) == 1
+    cell = (np.clip(row, -1, rows) + 1)*(cols + 2) + np.clip(col, -1, cols) + 1
+    blocked = walls.ravel()[cell]
+    blocked &= (cell != cell[:, :1]) & (cell != cell[:, -1:])
+    ans[finite] = ~blocked.any(axis=1)
+    return ans.reshape(shape)
+
+def door_table(layout, piz, obj_doors, step=SAMPLE_STEP):
+    '''door flags seen from every cell of one floor, bit-packed (rows, cols, bytes)'''
+
+    rows, cols = np.shape(layout)
+    num = len(obj_doors['xy'])
+    on_floor = np.flatnonzero(obj_doors['iz'] == piz)
+    ans = np.zeros((rows*cols, num), dtype=bool)
+    for start in range(0, rows*cols, CHUNK_CELLS):
+        cell = np.arange(start, min(start + CHUNK_CELLS, rows*cols))
+        viewer = np.stack([cell % cols, cell // cols], axis=1) * DXY
+        ans[cell[:, None], on_floor] = line_of_sight(layout, viewer[:, None], obj_doors['xy'][on_floor], step)
+    return np.packbits(ans, axis=1).reshape(rows, cols, -1)
+
+def load_door_table(layout, piz, obj_doors, step=SAMPLE_STEP, cache_dir=LAYOUT_CACHE):
+    '''door table of one floor, from its cache if built for this layout and these doors'''
+
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(layout, dtype=np.uint8).tobytes())
+    digest.update(np.ascontiguousarray(obj_doors['xy'], dtype=float).tobytes())
+    digest.update(np.ascontiguousarray(obj_doors['iz'], dtype=int).tobytes())
+    name = f'vis_doors{piz}_s{step}_{digest.hexdigest()[:16]}'
+    cache_file = os.path.join(cache_dir, f'{name}.npy')
+    if not os.path.exists(cache_file):
+        table = door_table(layout, piz, obj_doors, step)
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_file = os.path.join(cache_dir, f'{name}.tmp.npy')
+        np.save(tmp_file, table)
+        os.replace(tmp_file, cache_file)
+    return np.load(cache_file, mmap_mode='r')
+
+class Visibility:
+    '''shooter line of sight to npcs and doors on the wall grid (unpadded layouts)'''
+
+    def __init__(self, full_layout, obj_doors, cache=False, step=SAMPLE_STEP, cache_dir=LAYOUT_CACHE):
+        self.layouts = {int(name.replace('layout', '')): layout for name, layout in full_layout.items()}
+        self.doors = obj_doors
+        self.step = step
+        self.is_open = obj_doors['chan'] == 2
+        self.tables = dict()
+        if cache:
+            for piz, layout in self.layouts.items():
+                self.tables[piz] = load_door_table(layout, piz, obj_doors, step, cache_dir)
+
+    def objects(self, px, py, piz, xy, iz):
+        '''flags (uint8) of objects at local xy (N, 2) on floors iz (N,)'''
+
+        ans = np.zeros(len(xy), dtype=np.uint8)
+        if piz not in self.layouts or np.isnan(px):
+            return ans
+        same = iz == piz
+        ans[same] = line_of_sight(self.layouts[piz], [px, py], xy[same], self.step)
+        return ans
+
+    def npcs(self, px, py, piz, pos_npc):
+        '''flags of npcs at raw Unity positions (N, 3)'''
+
+        pos = transform_array(pos_npc)
+        return self.objects(px, py, piz, pos[:,0:2], idx_floor(pos[:,0], pos[:,2]))
+
+    def all_doors(self, px, py, piz):
+        '''flags of every static door (open doors then closed doors, as in obj_doors)'''
+
+        pix, piy, _ = idx(px, py, 0)
+        table = self.tables.get(piz)
+        if table is not None and 0 <= piy < table.shape[0] and 0 <= pix < table.shape[1]:
+            return np.unpackbits(table[piy, pix], count=len(self.is_open))
+        return self.objects(px, py, piz, self.doors['xy'], self.doors['iz'])
+
+    def fill(self, frame, px, py, piz, force=False):
+        '''set a parsed frame's visibility flags where Unity left them out (or all, with force)'''
+
+        if force or frame.get('vis_npc') is None:
+            frame['vis_npc'] = self.npcs(px, py, piz, frame['pos_npc'])
+        if force or frame.get('vis_do') is None or frame.get('vis_dc') is None:
+            doors = self.all_doors(px, py, piz)
+            frame['vis_do'] = doors[self.is_open]
+            frame['vis_dc'] = doors[~self.is_open]
+        return frame
+
+if __name__ == "__main__":
+    visibility = Visibility(load_layouts(), load_door_objects(), cache=True)
+    for piz, table in visibility.tables.items():
+        print(f'==> FLOOR {piz}: door flags for {table.shape[0]}×{table.shape[1]} cells')
@@ -0,0 +1,274 @@
+# ----------------------------------------------------------------------------
+# wire.py
+# Chris McClurg
+#
+# This script defines the UDP message formats exchanged with Unity. Frames
+# arrive either as the original ';'/',' delimited text or, once negotiated,
+# as a compact binary layout (little-endian):
+#
+#   header  '<2sBBHHH'  magic b'SP', version, kind=1, n_npc, n_do, n_dc
+#   session '<H'        session id (version 2 onwards, 0 for none)
+#   time    '<3f'       total time, shoot time, time ahead
+#   player  '<6f4i5f'   pos xyz, rot xyz, shots, reloads, dry fires, hits,
+#                       focus xyz, eye diameter right, eye diameter left
+#   focus   '<B' + str  length-prefixed utf-8 name of the focused object
+#   npcs    float32 (n_npc, 3) positions, uint8 (n_npc,) visible, uint8 alive
+#   doors   uint8 (n_do,) open visible, uint8 (n_dc,) closed visible
+#   robots  '<B' + float32 (n, 3) robot positions (optional trailer)
+#
+# Version 3 leaves out the visibility bytes (npc visible, door sections);
+# those flags are parsed as None and computed here (see visibility.py).
+#
+# Replies mirror this: header '<2sBBfH' (magic, version 1, kind=2, time, n)
+# followed by float32 (n,) blocks for Unity x, y and z, then '<BB' with the
+# model used and the model wanted (text replies add a ';used,wanted' section),
+# then '<B' and '<B3f' per robot with an intercept point: robot index and
+# Unity xyz (text replies add a ';index,x,y,z,...' section). All of these
+# trail the coordinates, so older clients ignore them. Text frames may start
+# with an '@<session>;' section to name their session and end with the robot
+# section (visible to each robot, then each robot's xyz).
+# ----------------------------------------------------------------------------
+
+import queue
+import socket
+import struct
+import threading
+import numpy as np
+
+MAGIC = b'SP'           # first two bytes of every binary message
+VERSION = 3             # newest binary frame version understood here
+REPLY_VERSION = 1       # binary reply version (same for all frame versions)
+KIND_FRAME = 1          # Unity -> Python state frame
+KIND_REPLY = 2          # Python -> Unity predicted trajectory
+HELLO = 'HELLO'         # text handshake, 'HELLO;<version>' both ways
+
+FRAME_HEADER = struct.Struct('<2sBBHHH')
+FRAME_SESSION = struct.Struct('<H')
+FRAME_TIME = struct.Struct('<3f')
+FRAME_PLAYER = struct.Struct('<6f4i5f')
+REPLY_HEADER = struct.Struct('<2sBBfH')
+REPLY_MODEL = struct.Struct('<BB')
+REPLY_TARGET = struct.Struct('<B3f')
+
+def is_binary(data_in):
+    '''check whether a message uses the binary format'''
+    return isinstance(data_in, bytes) and data_in[:2] == MAGIC
+
+def is_hello(data_in):
+    '''check whether a message is a protocol handshake'''
+    if isinstance(data_in, bytes):
+        return data_in[:len(HELLO)] == HELLO.encode()
+    return data_in.startswith(HELLO)
+
+def answer_hello(data_in):
+    '''reply to a handshake with the agreed version (0 keeps text)'''
+
+    if isinstance(data_in, bytes):
+        data_in = data_in.decode('utf-8', errors='replace')
+    sects = data_in.split(';')
+    try:
+        asked = int(sects[1])
+    except (IndexError, ValueError):
+        asked = 0
+    agreed = min(max(asked, 0), VERSION)
+    return f'{HELLO};{agreed}'
+
+def parse_text(data_in):
+    '''parse a ';'/',' delimited text frame into a dict of arrays'''
+
+    if isinstance(data_in, bytes):
+        data_in = data_in.decode('utf-8')
+    ans = dict()
+
+    # optional session section
+    ans['session'] = None
+    if data_in.startswith('@'):
+        session_info, data_in = data_in.split(";", 1)
+        ans['session'] = int(session_info[1:])
+
+    # robot info may follow the door sections
+    sects = data_in.split(";")
+    time_info, player_info, npc_info, do_info, dc_info = sects[:5]
+
+    # parse time data
+    time_data = [float(xi) for xi in time_info.split(',') if len(xi) > 0]
+    ans['time_total'] = time_data[0]
+    ans['time_shoot'] = time_data[1]
+    ans['time_ahead'] = int(time_data[2])
+
+    # parse player data
+    player_data = [xi for xi in player_info.split(',') if len(xi) > 0]
+    ans['eye_diam_l'] = float(player_data.pop())
+    ans['eye_diam_r'] = float(player_data.pop())
+    focus_z = float(player_data.pop())
+    focus_y = float(player_data.pop())
+    focus_x = float(player_data.pop())
+    ans['eye_focus'] = np.array([focus_x, focus_y, focus_z])
+    ans['eye_focus_o'] = player_data.pop()
+    ans['num_hits'] = int(player_data.pop())
+    ans['num_dryfire'] = int(player_data.pop())
+    ans['num_reload'] = int(player_data.pop())
+    ans['num_shot'] = int(player_data.pop())
+    ans['shooter'] = np.array([float(xi) for xi in player_data])
+
+    # parse npc data (x, y, z, visible, alive per npc)
+    npc_data = [float(xi) for xi in npc_info.split(',') if len(xi) > 0]
+    num_seg = int(len(npc_data) / 5)
+    npc_data = np.reshape(npc_data[:5*num_seg], (num_seg, 5))
+    ans['pos_npc'] = npc_data[:, 0:3]
+    ans['vis_npc'] = npc_data[:, 3].astype(int)
+    ans['sta_npc'] = npc_data[:, 4].astype(int)
+
+    # parse door data
+    ans['vis_do'] = np.array([int(xi) for xi in do_info.split(',') if len(xi) > 0], dtype=int)
+    ans['vis_dc'] = np.array([int(xi) for xi in dc_info.split(',') if len(xi) > 0], dtype=int)
+
+    # parse robot data (visible flag per robot, then xyz per robot)
+    ans['robots'] = None
+    if len(sects) > 5:
+        robot_data = [float(xi) for xi in sects[5].split(',') if len(xi) > 0]
+        num_robot = int(len(robot_data) / 4)
+        ans['robots'] = np.reshape(robot_data[num_robot:4*num_robot], (num_robot, 3))
+    return ans
+
+def parse_robots(data_in, offset):
+    '''robot positions trailing a binary frame (None if not sent)'''
+
+    if offset >= len(data_in):
+        return None
+    num_robot = data_in[offset]
+    pos = np.frombuffer(data_in, dtype='<f4', count=3*num_robot, offset=offset+1)
+    return np.round(pos.astype(float), 1).reshape(num_robot, 3)
+
+def parse_binary(data_in):
+    '''decode a binary frame into the same dict of arrays as parse_text'''
+
+    magic, version, kind, n_npc, n_do, n_dc = FRAME_HEADER.unpack_from(data_in, 0)
+    if magic != MAGIC or kind != KIND_FRAME or version > VERSION:
+        raise ValueError(f'unsupported binary frame (version {version}, kind {kind})')
+    offset = FRAME_HEADER.size
+    ans = dict()
+
+    # session id (version 2 onwards, 0: none)
+    ans['session'] = None
+    if version >= 2:
+        ans['session'] = FRAME_SESSION.unpack_from(data_in, offset)[0] or None
+        offset += FRAME_SESSION.size
+
+    # time data (time ahead is a whole number of seconds)
+    time_total, time_shoot, time_ahead = FRAME_TIME.unpack_from(data_in, offset)
+    offset += FRAME_TIME.size
+    ans['time_total'] = time_total
+    ans['time_shoot'] = time_shoot
+    ans['time_ahead'] = int(time_ahead)
+
+    # player data; positions are rounded to 0.1 by Unity, so undo float32 noise
+    player = FRAME_PLAYER.unpack_from(data_in, offset)
+    offset += FRAME_PLAYER.size
+    ans['shooter'] = np.round(np.array(player[0:6]), 1)
+    ans['num_shot'], ans['num_reload'], ans['num_dryfire'], ans['num_hits'] = player[6:10]
+    ans['eye_focus'] = np.round(np.array(player[10:13]), 1)
+    ans['eye_diam_r'], ans['eye_diam_l'] = player[13:15]
+    num_char = data_in[offset]
+    ans['eye_focus_o'] = data_in[offset+1:offset+1+num_char].decode('utf-8')
+    offset += 1 + num_char
+
+    # npc data
+    pos_npc = np.frombuffer(data_in, dtype='<f4', count=3*n_npc, offset=offset)
+    offset += 4*3*n_npc
+    ans['pos_npc'] = np.round(pos_npc.astype(float), 1).reshape(n_npc, 3)
+    ans['vis_npc'] = None
+    if version < 3:
+        ans['vis_npc'] = np.frombuffer(data_in, dtype=np.uint8, count=n_npc, offset=offset).astype(int)
+        offset += n_npc
+    ans['sta_npc'] = np.frombuffer(data_in, dtype=np.uint8, count=n_npc, offset=offset).astype(int)
+    offset += n_npc
+
+    # door data (not sent from version 3)
+    ans['vis_do'], ans['vis_dc'] = None, None
+    if version < 3:
+        ans['vis_do'] = np.frombuffer(data_in, dtype=np.uint8, count=n_do, offset=offset).astype(int)
+        offset += n_do
+        ans['vis_dc'] = np.frombuffer(data_in, dtype=np.uint8, count=n_dc, offset=offset).astype(int)
+        offset += n_dc
+
+    # robot data (optional trailer)
+    ans['robots'] = parse_robots(data_in, offset)
+    return ans
+
+def parse_frame(data_in):
+    '''parse a Unity frame in either format'''
+    if is_binary(data_in):
+        return parse_binary(data_in)
+    return parse_text(data_in)
+
+def encode_reply(t, x_unity, y_unity, z_unity, mSel=None, wanted=None, targets=None):
+    '''pack predictions (and optionally the model used/wanted, then robot targets) into a binary reply'''
+
+    num = len(x_unity)
+    head = REPLY_HEADER.pack(MAGIC, REPLY_VERSION, KIND_REPLY, t, num)
+    body = np.array([x_unity, y_unity, z_unity], dtype='<f4').reshape(3, num)
+    if mSel is None:
+        return head + body.tobytes()
+    ans = head + body.tobytes() + REPLY_MODEL.pack(mSel, mSel if wanted is None else wanted)
+    if targets is None:
+        return ans
+    return ans + struct.pack('<B', len(targets)) + b''.join(REPLY_TARGET.pack(*target) for target in targets)
+
+class Comms:
+    '''UDP socket that exchanges raw bytes with Unity on a background thread'''
+
+    def __init__(self, udpIP="127.0.0.1", portTX=8000, portRX=8001, bufSize=65535, maxQueue=64):
+        self.udpIP = udpIP
+        self.portTX = portTX
+        self.bufSize = bufSize
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((udpIP, portRX))
+
+        # bounded queue of received messages, oldest dropped when full
+        self._queue = queue.Queue(maxsize=maxQueue)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._read_loop, daemon=True)
+        self._thread.start()
+
+    def _read_loop(self):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(self.bufSize)
+            except OSError:
+                return
+            while True:
+                try:
+                    self._queue.put_nowait((data, addr))
+                    break
+                except queue.Full:
+                    try:
+                        self._queue.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+
+    def ReadReceivedFrom(self, timeout=0.0):
+        '''return the next (message, sender address), waiting up to timeout seconds'''
+        try:
+            if timeout > 0:
+                return self._queue.get(timeout=timeout)
+            return self._queue.get_nowait()
+        except queue.Empty:
+            return None, None
+
+    def ReadReceivedData(self, timeout=0.0):
+        '''return the next message (bytes), waiting up to timeout seconds, else None'''
+        return self.ReadReceivedFrom(timeout)[0]
+
+    def SendData(self, data_out, addr=None):
+        '''send a text or binary message to Unity (the configured port by default)'''
+        if isinstance(data_out, str):
+            data_out = data_out.encode('utf-8')
+        if addr is None:
+            addr = (self.udpIP, self.portTX)
+        self.sock.sendto(data_out, addr)
+
+    def close(self):
+        self.sock.close()